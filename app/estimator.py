@@ -0,0 +1,226 @@
+# app/estimator.py
+"""
+Local nearest-neighbor nutrition estimator.
+
+Known foods are indexed by name (word tokens plus character trigrams,
+TF-IDF weighted). An unknown food is estimated from its closest neighbors
+that share a compatible serving, and the estimate carries a confidence
+score. Only low-confidence names need to go to the LLM.
+"""
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+MACROS = ("cal", "protein", "carbs", "fat")
+
+# Estimates below this confidence fall through to the LLM
+MIN_CONFIDENCE = float(os.getenv("LOCAL_ESTIMATE_MIN_CONFIDENCE", "0.5"))
+NEIGHBORS = 5
+HEAD_WEIGHT = 2.0
+REFRESH_SECONDS = 300
+# Longest postings list kept per feature. Common trigrams ("ed ", " ch") match a
+# large share of the catalog at a tiny idf; only their heaviest (shortest-name)
+# rows are kept, so a lookup never scans the whole catalog.
+MAX_POSTINGS = int(os.getenv("LOCAL_ESTIMATE_MAX_POSTINGS", "2000"))
+
+_WORD = re.compile(r"[a-z]+|\d+(?:\.\d+)?")
+
+
+def _words(text: str) -> List[str]:
+    # crude singular form so "eggs" and "egg" share a token
+    return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+            for w in _WORD.findall(text.lower())]
+
+
+def _features(name: str) -> Dict[str, float]:
+    feats: Dict[str, float] = defaultdict(float)
+    words = _words(name)
+    for w in words:
+        feats["w:" + w] += 1.0
+        padded = f" {w} "
+        for i in range(len(padded) - 2):
+            feats["c:" + padded[i:i + 3]] += 0.5
+    if words:
+        # the last word is usually what the food is ("whole wheat pasta" is pasta)
+        feats["h:" + words[-1]] += HEAD_WEIGHT
+    return feats
+
+
+def _serving_units(serving_desc: str) -> frozenset:
+    """Unit words of a serving ("1 cup cooked" -> {cup, cooked}); numbers are ignored"""
+    return frozenset(w for w in _words(serving_desc or "") if not w[0].isdigit())
+
+
+class Estimate(NamedTuple):
+    serving_desc: str
+    macros: Dict[str, float]
+    confidence: float
+    neighbors: List[str]
+
+
+class FoodIndex:
+    """Inverted index over food names for cosine nearest-neighbor lookups"""
+
+    def __init__(self, foods: Iterable[Dict[str, Any]]):
+        unique: Dict[str, Dict[str, Any]] = {}
+        for f in foods:
+            if f.get("name"):
+                # the same name in several users' lists would just be one neighbor repeated
+                unique.setdefault(f["name"].strip().lower(), f)
+        self.foods = list(unique.values())
+        raw = [_features(f["name"]) for f in self.foods]
+        df: Dict[str, int] = defaultdict(int)
+        for feats in raw:
+            for k in feats:
+                df[k] += 1
+        n = len(self.foods)
+        self._idf = {k: math.log((1 + n) / (1 + d)) + 1 for k, d in df.items()}
+        # features never seen are as rare as it gets
+        self._unseen_idf = math.log(1 + n) + 1
+        self._units = [_serving_units(f.get("serving_desc", "")) for f in self.foods]
+        self._postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for row, feats in enumerate(raw):
+            for k, w in self._weigh(feats).items():
+                self._postings[k].append((row, w))
+        for k, rows in self._postings.items():
+            if len(rows) > MAX_POSTINGS:
+                self._postings[k] = heapq.nlargest(MAX_POSTINGS, rows, key=lambda p: p[1])
+
+    def __len__(self) -> int:
+        return len(self.foods)
+
+    def _weigh(self, feats: Dict[str, float]) -> Dict[str, float]:
+        vec = {k: v * self._idf.get(k, self._unseen_idf) for k, v in feats.items()}
+        norm = math.sqrt(sum(w * w for w in vec.values())) or 1.0
+        return {k: w / norm for k, w in vec.items()}
+
+    def neighbors(self, name: str, k: int = NEIGHBORS, exclude: Optional[int] = None) -> List[Tuple[float, int]]:
+        """Top-k (similarity, row) pairs; ``exclude`` drops one row (leave-one-out evaluation)"""
+        scores: Dict[int, float] = defaultdict(float)
+        for feat, qw in self._weigh(_features(name)).items():
+            for row, w in self._postings.get(feat, ()):
+                scores[row] += qw * w
+        scores.pop(exclude, None)
+        return heapq.nlargest(k, ((s, row) for row, s in scores.items()))
+
+    def estimate(self, name: str, k: int = NEIGHBORS, exclude: Optional[int] = None) -> Optional[Estimate]:
+        """Similarity-weighted macros of the nearest neighbors with a serving like the closest one's.
+
+        Confidence is the closest neighbor's similarity, discounted when the
+        neighbors used disagree on calories.
+        """
+        hits = self.neighbors(name, k, exclude)
+        if not hits:
+            return None
+        top_sim, top_row = hits[0]
+        top_units = self._units[top_row]
+        used = [(s, row) for s, row in hits
+                if row == top_row or not top_units or self._units[row] & top_units]
+        total = sum(s for s, _ in used)
+        macros = {m: sum(s * float(self.foods[row][m]) for s, row in used) / total for m in MACROS}
+        cal_mean = macros["cal"]
+        cal_var = sum(s * (float(self.foods[row]["cal"]) - cal_mean) ** 2 for s, row in used) / total
+        spread = math.sqrt(cal_var) / cal_mean if cal_mean > 0 else 0.0
+        return Estimate(
+            serving_desc=self.foods[top_row].get("serving_desc") or "1 serving",
+            macros={m: round(v, 1) for m, v in macros.items()},
+            confidence=round(min(top_sim, 1.0) / (1.0 + spread), 3),
+            neighbors=[self.foods[row]["name"] for _, row in used],
+        )
+
+
+class LocalEstimator:
+    """A FoodIndex rebuilt from ``loader`` when stale, counting local hits and LLM fallbacks.
+
+    Rebuilds run in a background thread and swap the new index in when done;
+    lookups keep using the previous index meanwhile and never wait for a build.
+    Until the first build finishes every lookup falls through to the LLM.
+    """
+
+    def __init__(self, loader: Optional[Callable[[], Iterable[Dict[str, Any]]]] = None,
+                 min_confidence: float = MIN_CONFIDENCE, refresh_seconds: float = REFRESH_SECONDS):
+        self.loader = loader
+        self.min_confidence = min_confidence
+        self.refresh_seconds = refresh_seconds
+        self._index: Optional[FoodIndex] = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+        self._build: Optional[threading.Thread] = None
+        # bumped by invalidate(), so a build that started before it is not taken as fresh
+        self._generation = 0
+        self.local_hits = 0
+        self.fallbacks = 0
+        self.builds = 0
+
+    def invalidate(self):
+        """Rebuild the index on next use (e.g. after a bulk catalog import)"""
+        with self._lock:
+            self._generation += 1
+            self._built_at = 0.0
+
+    def refresh(self, wait: bool = False):
+        """Start a background rebuild unless one is running; ``wait`` blocks until it is done"""
+        if self.loader is None:
+            return
+        with self._lock:
+            if self._build is None or not self._build.is_alive():
+                self._build = threading.Thread(target=self._rebuild, args=(self.loader, self._generation),
+                                               name="food-index", daemon=True)
+                self._build.start()
+            build = self._build
+        if wait:
+            build.join()
+
+    def _rebuild(self, loader: Callable[[], Iterable[Dict[str, Any]]], generation: int):
+        started = time.monotonic()
+        try:
+            index = FoodIndex(loader())
+        except Exception as e:
+            print(f"[food-index] {type(e).__name__}: {e}")
+            with self._lock:
+                # retry after the refresh interval, not on every lookup
+                self._built_at = started
+            return
+        with self._lock:
+            self._index = index
+            self._built_at = started if generation == self._generation else 0.0
+            self.builds += 1
+
+    def index(self) -> Optional[FoodIndex]:
+        """The current index, possibly stale while a rebuild runs; None before the first build"""
+        if self.loader is None:
+            return None
+        if time.monotonic() - self._built_at > self.refresh_seconds:
+            self.refresh()
+        return self._index
+
+    def estimate(self, name: str) -> Optional[Estimate]:
+        """A confident local estimate, or None when the caller should ask the LLM"""
+        index = self.index()
+        est = index.estimate(name) if index else None
+        with self._lock:
+            if est is not None and est.confidence >= self.min_confidence:
+                self.local_hits += 1
+                return est
+            self.fallbacks += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.local_hits + self.fallbacks
+        return {
+            "indexed_foods": len(self._index) if self._index else 0,
+            "index_builds": self.builds,
+            "index_building": self._build is not None and self._build.is_alive(),
+            "min_confidence": self.min_confidence,
+            "local_hits": self.local_hits,
+            "llm_fallbacks": self.fallbacks,
+            "llm_calls_avoided_rate": round(self.local_hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+local_estimator = LocalEstimator()
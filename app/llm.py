@@ -1,11 +1,27 @@
 # app/llm.py
-import os, json, subprocess, shlex
+import os, json, subprocess, shlex, hashlib, random, threading, time
+from collections import OrderedDict, defaultdict
 from dotenv import load_dotenv
+from app.estimator import local_estimator
 load_dotenv()
 
-BACKEND = os.getenv("LLM_BACKEND", "ollama").lower()  # ollama | openai | offline
+BACKEND = os.getenv("LLM_BACKEND", "ollama").lower()  # ollama | openai | offline | replay
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
 
+# Record every model call (prompt, raw reply, latency) to this JSONL fixture
+RECORD_PATH = os.getenv("LLM_RECORD")
+# Replay backend: fixture to serve, latency scale (1 = as recorded, 0 = none),
+# and whether an unrecorded prompt is an error or gets a recorded reply of the same kind
+REPLAY_PATH = os.getenv("LLM_REPLAY")
+REPLAY_LATENCY_SCALE = float(os.getenv("LLM_REPLAY_LATENCY_SCALE", "1"))
+REPLAY_STRICT = os.getenv("LLM_REPLAY_STRICT", "0") == "1"
+
+# Hard deadline per model call; calls slower than LLM_SLOW_SECONDS count against the breaker
+TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+SLOW_SECONDS = float(os.getenv("LLM_SLOW_SECONDS", "10"))
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
 _SYSTEM = """
 You are a registered dietitian & nutrition coach.
 You MUST return exactly one JSON object with keys: speak (string), done (bool), actions (array).
@@ -20,6 +36,7 @@ Required action formats:
 - add_food: {"action": "add_food", "args": {"name": "food_name", "serving_desc": "description", "cal": number, "protein": number, "carbs": number, "fat": number, "provenance": "llm_estimate"}}
 - log_meal: {"action": "log_meal", "args": {"date": "YYYY-MM-DD", "items": [{"name": "food_name", "qty": number}]}}
 - day_summary: {"action": "day_summary", "args": {"date": "YYYY-MM-DD"}}
+- suggest_meal: {"action": "suggest_meal", "args": {}}
 
 Behavioral rules:
 1) For food logging (e.g., "log 2 eggs", "add 1 leg quarter and rice meal"):
@@ -38,6 +55,7 @@ Behavioral rules:
 4) Use proper food names (singular form)
 5) Never say "recorded" without actions
 6) ALWAYS include a meaningful speak message - never leave it empty
+   (for suggest_meal the app replaces speak with the suggestions)
 7) CRITICAL: Always use date "2025-09-14" for all log_meal actions
 """
 
@@ -45,6 +63,8 @@ Behavioral rules:
 # ---------- OFFLINE (fallback) ----------
 def _offline_chat(history):
     last = (history[-1]["content"] if history else "").lower()
+    if "what should i eat" in last or "suggest a meal" in last:
+        return json.dumps({"speak":"Here's what fits the rest of today.","done":False,"actions":[{"action":"suggest_meal","args":{}}]})
     if "total" in last or ("show" in last and "today" in last):
         return json.dumps({"speak":"Here are today's totals.","done":False,"actions":[{"action":"day_summary","args":{}}]})
     if "set goal" in last:
@@ -118,8 +138,11 @@ def _offline_estimate(name:str):
 # ---------- OLLAMA (local, free) ----------
 def _ollama(prompt: str) -> str:
     cmd = f"ollama run {shlex.quote(OLLAMA_MODEL)} {shlex.quote(prompt)}"
-    res = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-    return res.stdout.strip() if res.returncode == 0 else res.stderr.strip()
+    # TimeoutExpired kills the child, so a hung model can't hold the request
+    res = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=TIMEOUT_SECONDS)
+    if res.returncode != 0:
+        raise RuntimeError(f"ollama exited with {res.returncode}: {res.stderr.strip()[:200]}")
+    return res.stdout.strip()
 
 def _ollama_json(prompt: str) -> str:
     # wrap system + user into a single prompt; many local models prefer this style
@@ -140,9 +163,13 @@ def _ollama_estimate(name:str):
     return _ollama_json(prompt)
 
 # ---------- OPENAI (paid/credits) ----------
-def _openai_chat(history):
+def _openai_client():
     from openai import OpenAI
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    # no client-side retries: the circuit breaker decides when to try again
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=TIMEOUT_SECONDS, max_retries=0)
+
+def _openai_chat(history):
+    client = _openai_client()
     messages = [{"role":"system","content":_SYSTEM}] + history
     r = client.chat.completions.create(
         model=os.getenv("MODEL","gpt-4o-mini"),
@@ -152,8 +179,7 @@ def _openai_chat(history):
     return r.choices[0].message.content
 
 def _openai_estimate(name:str):
-    from openai import OpenAI
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    client = _openai_client()
     messages = [
         {"role":"system","content":_SYSTEM},
         {"role":"user","content": f"User mentioned '{name}' which is not in DB. Return ONE JSON object with exactly one add_food action for best-average macros and a short 'speak'. Set provenance='llm_estimate'."}
@@ -165,26 +191,261 @@ def _openai_estimate(name:str):
     )
     return r.choices[0].message.content
 
+# ---------- RECORD / REPLAY ----------
+def _prompt_key(kind: str, prompt) -> str:
+    canonical = json.dumps(prompt, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"{kind}\n{canonical}".encode("utf-8")).hexdigest()[:32]
+
+_record_lock = threading.Lock()
+
+def _record(kind: str, prompt, reply: str, latency: float):
+    entry = {"kind": kind, "key": _prompt_key(kind, prompt), "backend": BACKEND,
+             "prompt": prompt, "reply": reply, "latency": round(latency, 4)}
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    with _record_lock, open(RECORD_PATH, "a", encoding="utf-8") as f:
+        f.write(line)
+
+class Replayer:
+    """Serve recorded replies by prompt, sleeping for the recorded latency times ``latency_scale``.
+
+    Repeated recordings of one prompt are served in turn. An unrecorded prompt
+    raises KeyError when ``strict``; otherwise it gets a recorded reply of the
+    same kind and a latency drawn from that kind's recorded distribution, both
+    chosen deterministically from the prompt.
+    """
+    def __init__(self, path: str, latency_scale: float = 1.0, strict: bool = False,
+                 timeout: float = TIMEOUT_SECONDS):
+        self.latency_scale = latency_scale
+        self.strict = strict
+        self.timeout = timeout
+        self._by_key = defaultdict(list)
+        self._by_kind = defaultdict(list)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    e = json.loads(line)
+                    self._by_key[e["key"]].append(e)
+                    self._by_kind[e["kind"]].append(e)
+        self._turns = defaultdict(int)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def reply(self, kind: str, prompt) -> str:
+        key = _prompt_key(kind, prompt)
+        with self._lock:
+            recorded = self._by_key.get(key)
+            if recorded:
+                entry = recorded[self._turns[key] % len(recorded)]
+                self._turns[key] += 1
+                latency = entry["latency"]
+                self.hits += 1
+            else:
+                same_kind = self._by_kind.get(kind)
+                if self.strict or not same_kind:
+                    raise KeyError(f"no recorded {kind} reply for prompt {key}")
+                rng = random.Random(key)
+                entry = rng.choice(same_kind)
+                latency = rng.choice(same_kind)["latency"]
+                self.misses += 1
+        if self.latency_scale > 0:
+            delay = latency * self.latency_scale
+            # honour the call deadline like a live backend would
+            time.sleep(min(delay, self.timeout))
+            if delay > self.timeout:
+                raise TimeoutError(f"replayed {kind} call exceeded {self.timeout:g}s")
+        return entry["reply"]
+
+    def stats(self):
+        return {"recorded": sum(len(v) for v in self._by_key.values()),
+                "hits": self.hits, "misses": self.misses, "latency_scale": self.latency_scale}
+
+_replayer = None
+
+def replayer() -> Replayer:
+    global _replayer
+    if _replayer is None:
+        if not REPLAY_PATH:
+            raise RuntimeError("LLM_BACKEND=replay needs LLM_REPLAY=<fixture.jsonl>")
+        _replayer = Replayer(REPLAY_PATH, REPLAY_LATENCY_SCALE, REPLAY_STRICT, TIMEOUT_SECONDS)
+    return _replayer
+
+# ---------- CIRCUIT BREAKER ----------
+class LLMUnavailable(RuntimeError):
+    """The backend's breaker is open or the call failed, and the caller asked not to degrade"""
+
+class CircuitBreaker:
+    """Opens after ``failures`` consecutive errors or slow calls and rejects calls for ``reset_seconds``.
+
+    After that one trial call is let through (half-open): success closes the
+    breaker, failure opens it again.
+    """
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES,
+                 reset_seconds: float = BREAKER_RESET_SECONDS, slow_seconds: float = SLOW_SECONDS):
+        self.name = name
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.slow_seconds = slow_seconds
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.slow = 0
+        self.rejected = 0
+        self.trips = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state, self._trial = "half_open", False
+            if self.state == "closed" or (self.state == "half_open" and not self._trial):
+                self._trial = self.state == "half_open"
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, latency: float, error: bool = False):
+        with self._lock:
+            self.calls += 1
+            slow = not error and latency > self.slow_seconds
+            self.errors += error
+            self.slow += slow
+            if error or slow:
+                self._consecutive += 1
+                if self.state == "half_open" or self._consecutive >= self.failures:
+                    if self.state != "open":
+                        self.trips += 1
+                    self.state, self._opened_at, self._trial = "open", time.monotonic(), False
+            else:
+                self._consecutive = 0
+                self.state, self._trial = "closed", False
+
+    def stats(self):
+        with self._lock:
+            retry_in = max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+            return {"state": self.state, "consecutive_failures": self._consecutive,
+                    "retry_in_seconds": round(retry_in, 1) if self.state == "open" else 0.0,
+                    "calls": self.calls, "errors": self.errors, "slow": self.slow,
+                    "rejected": self.rejected, "trips": self.trips}
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def breaker(backend: str = None) -> CircuitBreaker:
+    backend = backend or BACKEND
+    with _breakers_lock:
+        if backend not in _breakers:
+            _breakers[backend] = CircuitBreaker(backend)
+        return _breakers[backend]
+
+# Last good reply per prompt, served while the backend is unavailable
+_RECENT_MAX = 512
+_recent = OrderedDict()
+_recent_lock = threading.Lock()
+_degraded = defaultdict(int)
+
+def _remember(key: str, reply: str):
+    with _recent_lock:
+        _recent[key] = reply
+        _recent.move_to_end(key)
+        while len(_recent) > _RECENT_MAX:
+            _recent.popitem(last=False)
+
+def _degrade(key: str, fallback):
+    with _recent_lock:
+        cached = _recent.get(key)
+        _degraded["cached" if cached is not None else "offline"] += 1
+    return cached if cached is not None else fallback()
+
+def _call(kind: str, prompt, live, fallback, degrade: bool = True):
+    """One model call: replayed, or made live and recorded when LLM_RECORD is set.
+
+    Calls go through the backend's circuit breaker. While it is open, or when
+    the call fails, the last good reply to the same prompt or ``fallback()`` is
+    returned instead, or LLMUnavailable is raised when ``degrade`` is False.
+    """
+    if BACKEND == "offline":
+        # already the fallback path: nothing to break
+        started = time.perf_counter()
+        reply = live()
+        if RECORD_PATH:
+            _record(kind, prompt, reply, time.perf_counter() - started)
+        return reply
+    key = _prompt_key(kind, prompt)
+    cb = breaker()
+    if not cb.allow():
+        if not degrade:
+            raise LLMUnavailable(f"{BACKEND} circuit breaker is open")
+        return _degrade(key, fallback)
+    started = time.perf_counter()
+    try:
+        reply = replayer().reply(kind, prompt) if BACKEND == "replay" else live()
+    except Exception as e:
+        if BACKEND == "replay" and isinstance(e, KeyError):
+            # a strict replay miss is a fixture problem, not a backend failure
+            raise
+        cb.record(time.perf_counter() - started, error=True)
+        # str(TimeoutExpired) carries the whole prompt
+        reason = f"{BACKEND} {kind} call failed: {type(e).__name__}: {' '.join(str(e).split())[:200]}"
+        print(f"[llm] {reason}")
+        if not degrade:
+            raise LLMUnavailable(reason) from e
+        return _degrade(key, fallback)
+    latency = time.perf_counter() - started
+    cb.record(latency)
+    if RECORD_PATH and BACKEND != "replay":
+        _record(kind, prompt, reply, latency)
+    _remember(key, reply)
+    return reply
+
+def llm_stats():
+    stats = {"backend": BACKEND, "timeout_seconds": TIMEOUT_SECONDS, "slow_seconds": SLOW_SECONDS,
+             "breakers": {name: cb.stats() for name, cb in list(_breakers.items())},
+             "degraded": dict(_degraded)}
+    if BACKEND == "replay" and _replayer is not None:
+        stats["replay"] = _replayer.stats()
+    return stats
+
 # ---------- PUBLIC API ----------
-def chat_once(history):
+def _live_chat(history):
     if BACKEND == "ollama":
         return _ollama_chat(history)
     if BACKEND == "openai":
         return _openai_chat(history)
     return _offline_chat(history)
 
-def estimate_food(name: str):
+def chat_once(history):
+    return _call("chat", history, lambda: _live_chat(history), lambda: _offline_chat(history))
+
+def _local_estimate_json(name: str, est) -> str:
+    # neighbor names stay out of the reply: the index is shared across users
+    return json.dumps({"speak":f"Estimated {name} from similar foods, confidence {est.confidence:.2f}.","done":False,"actions":[{"action":"add_food","args":{"name":name.lower(),"serving_desc":est.serving_desc,**est.macros,"provenance":"local_estimate"}}]})
+
+def _live_estimate(name: str):
     if BACKEND == "ollama":
         return _ollama_estimate(name)
     if BACKEND == "openai":
         return _openai_estimate(name)
     return _offline_estimate(name)
 
-def repair_with_errors(raw_json: str, errors: list[str]) -> str:
-    """
-    Ask the model to fix its last JSON given explicit error messages.
-    Must return ONE corrected JSON object (no prose).
-    """
+def _fallback_estimate(name: str):
+    # backend unavailable: the nearest known foods at any confidence beat a flat preset
+    index = local_estimator.index()
+    est = index.estimate(name) if index else None
+    return _local_estimate_json(name, est) if est is not None else _offline_estimate(name)
+
+def estimate_food(name: str, use_local: bool = True, degrade: bool = True):
+    """Estimate macros for an unknown food; ``degrade=False`` raises LLMUnavailable instead of guessing"""
+    # nearest known foods first; only low-confidence names reach the LLM
+    est = local_estimator.estimate(name) if use_local else None
+    if est is not None:
+        return _local_estimate_json(name, est)
+    return _call("estimate", name, lambda: _live_estimate(name), lambda: _fallback_estimate(name), degrade)
+
+def _live_repair(raw_json: str, errors: list[str]) -> str:
     if BACKEND == "offline":
         # in offline mode just echo raw; controller will bail or continue
         return raw_json
@@ -198,8 +459,7 @@ def repair_with_errors(raw_json: str, errors: list[str]) -> str:
         return _ollama_json(prompt)
 
     if BACKEND == "openai":
-        from openai import OpenAI
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        client = _openai_client()
         messages = [
             {"role":"system","content":_SYSTEM},
             {"role":"user","content": f"Your previous JSON had these problems:\n{err_bullets}\n\nReturn ONLY the corrected JSON."},
@@ -212,3 +472,11 @@ def repair_with_errors(raw_json: str, errors: list[str]) -> str:
         return r.choices[0].message.content
 
     return raw_json
+
+def repair_with_errors(raw_json: str, errors: list[str]) -> str:
+    """
+    Ask the model to fix its last JSON given explicit error messages.
+    Must return ONE corrected JSON object (no prose).
+    """
+    return _call("repair", {"raw": raw_json, "errors": errors}, lambda: _live_repair(raw_json, errors),
+                 lambda: raw_json)
@@ -2,6 +2,7 @@
 import json
 from datetime import date
 from app.llm import chat_once, estimate_food
+from app.estimator import local_estimator
 from db import api
 from dotenv import load_dotenv
 
@@ -71,6 +72,9 @@ def dispatch(act: dict):
     elif name == "day_summary":
         totals = api.day_summary(args.get("date"))
         print(f"[Totals {totals['date']}] kcal {totals['cal']:.0f} | P {totals['protein']:.0f} | C {totals['carbs']:.0f} | F {totals['fat']:.0f}")
+    elif name == "suggest_meal":
+        # the suggestion engine runs against the web API's per-user catalog
+        print("[meal suggestions are available from the web app: GET /api/suggestions]")
     else:
         print(f"[ignored unknown action: {name}]")
 
@@ -79,8 +83,8 @@ def required(d, keys):
     if missing:
         raise ValueError(f"Missing required fields: {', '.join(missing)}")
 
-def generate_sql_commands(actions):
-    """Generate SQL commands based on validated actions"""
+def generate_sql_commands(actions, user_id: int = 1):
+    """Generate parameterised SQL commands for a user's validated actions"""
     sql_commands = []
     
     for action in actions:
@@ -88,50 +92,51 @@ def generate_sql_commands(actions):
         args = action.get("args", {})
         
         if action_type == "add_food":
-            sql = f"""INSERT INTO foods (user_id, name, serving_desc, cal, protein, carbs, fat, provenance) 
-                     VALUES (1, '{args["name"]}', '{args["serving_desc"]}', {args["cal"]}, {args["protein"]}, {args["carbs"]}, {args["fat"]}, 'llm_estimate')"""
             sql_commands.append({
-                "sql": sql,
+                "sql": """INSERT INTO foods (user_id, name, serving_desc, cal, protein, carbs, fat, provenance) 
+                          VALUES (?, ?, ?, ?, ?, ?, ?, 'llm_estimate')""",
+                "params": [user_id, args["name"], args["serving_desc"], args["cal"], args["protein"],
+                           args["carbs"], args["fat"]],
                 "description": f"Add food: {args['name']}"
             })
             
         elif action_type == "log_meal":
-            from datetime import date
-            date = args.get("date", date.today().isoformat())  # Use today's date
+            log_date = args.get("date") or date.today().isoformat()
             # First create log entry
-            log_sql = f"INSERT INTO logs (user_id, log_date) VALUES (1, '{date}') ON CONFLICT DO NOTHING"
             sql_commands.append({
-                "sql": log_sql,
-                "description": f"Create log entry for {date}"
+                "sql": "INSERT INTO logs (user_id, log_date) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                "params": [user_id, log_date],
+                "description": f"Create log entry for {log_date}"
             })
             
             # Then add each food item
             for item in args.get("items", []):
                 food_name = item["name"]
-                qty = item["qty"]
-                log_item_sql = f"""INSERT INTO log_items (log_id, food_id, qty) 
-                                 VALUES ((SELECT id FROM logs WHERE user_id=1 AND log_date='{date}'), 
-                                        (SELECT id FROM foods WHERE name='{food_name}' AND user_id=1), {qty})"""
+                qty = item.get("qty", 1)
                 sql_commands.append({
-                    "sql": log_item_sql,
+                    "sql": """INSERT INTO log_items (log_id, food_id, qty) 
+                              VALUES ((SELECT id FROM logs WHERE user_id = ? AND log_date = ?), 
+                                      (SELECT id FROM foods WHERE name = ? AND (user_id = ? OR user_id IS NULL)
+                                       ORDER BY user_id IS NULL LIMIT 1), ?)""",
+                    "params": [user_id, log_date, food_name, user_id, qty],
                     "description": f"Log {qty} {food_name}"
                 })
                 
         elif action_type == "set_goal":
-            sql = f"""INSERT OR REPLACE INTO goals (user_id, calories, protein_g, carbs_g, fat_g) 
-                     VALUES (1, {args["calories"]}, {args["protein_g"]}, {args["carbs_g"]}, {args["fat_g"]})"""
             sql_commands.append({
-                "sql": sql,
-                "description": f"Set nutrition goals"
+                "sql": """INSERT OR REPLACE INTO goals (user_id, cal, protein, carbs, fat) 
+                          VALUES (?, ?, ?, ?, ?)""",
+                "params": [user_id, args["calories"], args["protein_g"], args["carbs_g"], args["fat_g"]],
+                "description": "Set nutrition goals"
             })
     
     return sql_commands
 
-def execute_sql_command(sql: str, description: str = ""):
+def execute_sql_command(sql: str, description: str = "", params=()):
     """Execute a SQL command and return the result"""
     try:
         with api._conn() as conn:
-            cursor = conn.execute(sql)
+            cursor = conn.execute(sql, params)
             conn.commit()
             if description:
                 print(f"[SQL] {description}: {sql}")
@@ -168,6 +173,8 @@ def _log_meal_with_estimates(args):
 # ---- REPL ----
 def run_chat():
     api.run_schema()  # idempotent
+    local_estimator.loader = api.reference_foods
+    local_estimator.refresh(wait=True)
     history = []
     print("Diet coach ready. Type your request (e.g., 'log 2 eggs'). Ctrl+C to exit.")
     while True:
@@ -186,7 +193,7 @@ def run_chat():
         # Generate and execute SQL commands based on validated actions
         sql_commands = generate_sql_commands(turn["actions"])
         for sql_cmd in sql_commands:
-            result = execute_sql_command(sql_cmd["sql"], sql_cmd.get("description", ""))
+            result = execute_sql_command(sql_cmd["sql"], sql_cmd.get("description", ""), sql_cmd["params"])
             if not result["success"]:
                 print(f"[SQL Error] {result['error']}")
         
@@ -1,7 +1,8 @@
 # app/validator.py
+import math
 from typing import List, Dict, Any, Tuple
 
-ALLOWED_ACTIONS = {"set_goal", "add_food", "log_meal", "day_summary"}
+ALLOWED_ACTIONS = {"set_goal", "add_food", "log_meal", "day_summary", "suggest_meal"}
 
 def validate_payload(payload: Dict[str, Any]) -> Tuple[bool, List[str]]:
     errors: List[str] = []
@@ -51,9 +52,7 @@ def validate_payload(payload: Dict[str, Any]) -> Tuple[bool, List[str]]:
                 if k not in args or not _is_number(args[k]) or float(args[k]) < 0:
                     errors.append(f'actions[{i}].args.{k} missing or invalid (>=0 number)')
         elif name == "add_food":
-            for k in ["name", "serving_desc", "cal", "protein", "carbs", "fat"]:
-                if k not in args or (k in {"cal","protein","carbs","fat"} and (not _is_number(args[k]) or float(args[k]) < 0)) or (k in {"name","serving_desc"} and not isinstance(args[k], str)):
-                    errors.append(f'actions[{i}].args.{k} missing or invalid')
+            errors.extend(f'actions[{i}].args.{e}' for e in validate_food_args(args))
         elif name == "log_meal":
             items = args.get("items")
             if not isinstance(items, list) or not items:
@@ -67,13 +66,24 @@ def validate_payload(payload: Dict[str, Any]) -> Tuple[bool, List[str]]:
         elif name == "day_summary":
             # no required fields
             pass
+        elif name == "suggest_meal":
+            if "date" in args and not isinstance(args["date"], str):
+                errors.append(f'actions[{i}].args.date must be a "YYYY-MM-DD" string if present')
 
     return (len(errors) == 0), errors
 
 
+def validate_food_args(args: Dict[str, Any]) -> List[str]:
+    """Errors for add_food args; shared with the bulk food importer."""
+    errors: List[str] = []
+    for k in ["name", "serving_desc", "cal", "protein", "carbs", "fat"]:
+        if k not in args or (k in {"cal","protein","carbs","fat"} and (not _is_number(args[k]) or float(args[k]) < 0)) or (k in {"name","serving_desc"} and not isinstance(args[k], str)):
+            errors.append(f'{k} missing or invalid')
+    return errors
+
+
 def _is_number(x) -> bool:
     try:
-        float(x)
-        return True
+        return math.isfinite(float(x))
     except Exception:
         return False
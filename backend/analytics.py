@@ -0,0 +1,165 @@
+"""
+Vectorized nutrition analytics: rollups, rolling averages, goal adherence and streaks
+"""
+import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from database import get_user_daily_totals, get_user_goal_history
+
+MACROS = ("cal", "protein", "carbs", "fat")
+# Longest [start, end] range served: every day in it is materialized and returned
+MAX_RANGE_DAYS = 5 * 366
+
+
+class DailySeries(NamedTuple):
+    """Dense per-calendar-day series; days without logs hold zeros"""
+    dates: np.ndarray    # datetime64[D], shape (n,)
+    totals: np.ndarray   # float64, shape (n, 4) in MACROS order
+    logged: np.ndarray   # bool, shape (n,)
+
+
+def load_daily_series(user_id: int, start: str, end: str) -> DailySeries:
+    """Load a user's daily macro totals for [start, end] into columnar arrays"""
+    first = np.datetime64(start, "D")
+    dates = np.arange(first, np.datetime64(end, "D") + 1, dtype="datetime64[D]")
+    totals = np.zeros((len(dates), len(MACROS)))
+    logged = np.zeros(len(dates), dtype=bool)
+
+    rows = get_user_daily_totals(user_id, start, end)
+    if rows:
+        idx = (np.array([r[0] for r in rows], dtype="datetime64[D]") - first).astype(np.int64)
+        totals[idx] = np.array([r[1:] for r in rows], dtype=np.float64)
+        logged[idx] = True
+    return DailySeries(dates, totals, logged)
+
+
+def effective_goals(dates: np.ndarray, goal_rows: List[tuple], fallback: Dict[str, float]) -> np.ndarray:
+    """Goal targets per day: a goal dated that day, else the default (NULL date) goal"""
+    default = [fallback["calories"], fallback["protein_g"], fallback["carbs_g"], fallback["fat_g"]]
+    dated = []
+    for goal_date, *targets in goal_rows:
+        if goal_date is None:
+            default = targets
+        else:
+            dated.append((goal_date, targets))
+
+    goals = np.tile(np.asarray(default, dtype=np.float64), (len(dates), 1))
+    if dated:
+        goal_dates = np.array([d for d, _ in dated], dtype="datetime64[D]")
+        targets = np.array([t for _, t in dated], dtype=np.float64)
+        pos = np.minimum(np.searchsorted(goal_dates, dates), len(goal_dates) - 1)
+        hit = goal_dates[pos] == dates
+        goals[hit] = targets[pos[hit]]
+    return goals
+
+
+def rolling_mean(series: DailySeries, window: int) -> np.ndarray:
+    """Trailing mean over the logged days within each `window`-day span"""
+    sums = np.cumsum(np.vstack([np.zeros(len(MACROS)), series.totals]), axis=0)
+    counts = np.concatenate([[0], np.cumsum(series.logged)])
+    hi = np.arange(1, len(series.dates) + 1)
+    lo = np.maximum(hi - window, 0)
+    n = (counts[hi] - counts[lo])[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n > 0, (sums[hi] - sums[lo]) / n, 0.0)
+
+
+def rollup(series: DailySeries, period: str) -> List[Dict[str, Any]]:
+    """Sum and per-logged-day mean of each macro by ISO week or calendar month"""
+    if period == "week":
+        # 1970-01-01 was a Thursday; shift so buckets start on Monday
+        keys = (series.dates.astype(np.int64) + 3) // 7
+    elif period == "month":
+        keys = series.dates.astype("datetime64[M]").astype(np.int64)
+    else:
+        raise ValueError(f"Unknown rollup period: {period}")
+
+    _, starts = np.unique(keys, return_index=True)
+    sums = np.add.reduceat(series.totals, starts, axis=0)
+    days_logged = np.add.reduceat(series.logged.astype(np.int64), starts)
+    means = sums / np.maximum(days_logged, 1)[:, None]
+
+    out = []
+    for i, s in enumerate(starts):
+        out.append({
+            "start": str(series.dates[s]),
+            "days_logged": int(days_logged[i]),
+            "total": dict(zip(MACROS, np.round(sums[i], 1).tolist())),
+            "avg": dict(zip(MACROS, np.round(means[i], 1).tolist())),
+        })
+    return out
+
+
+def runs(mask: np.ndarray) -> Dict[str, int]:
+    """Longest and current (ending on the last day) runs of True values"""
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if not len(starts):
+        return {"current": 0, "longest": 0}
+    lengths = ends - starts
+    return {
+        "current": int(lengths[-1]) if ends[-1] == len(mask) else 0,
+        "longest": int(lengths.max()),
+    }
+
+
+def adherence(series: DailySeries, goals: np.ndarray, tolerance: float) -> Dict[str, Any]:
+    """Percent of goal per macro and the share of logged days on target.
+
+    A logged day is on target when calories are within ``tolerance`` of the
+    goal and protein reaches at least ``1 - tolerance`` of it.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pct = np.where(goals > 0, series.totals / goals * 100.0, 0.0)
+    on_target = (
+        series.logged
+        & (np.abs(pct[:, 0] - 100.0) <= tolerance * 100.0)
+        & (pct[:, 1] >= (1.0 - tolerance) * 100.0)
+    )
+    days_logged = int(series.logged.sum())
+    avg_pct = pct[series.logged].mean(axis=0) if days_logged else np.zeros(len(MACROS))
+    return {
+        "days_logged": days_logged,
+        "days_on_target": int(on_target.sum()),
+        "adherence_pct": round(on_target.sum() / days_logged * 100.0, 1) if days_logged else 0.0,
+        "avg_pct_of_goal": dict(zip(MACROS, np.round(avg_pct, 1).tolist())),
+        "on_target": on_target,
+    }
+
+
+def compute_analytics(user_id: int, fallback_goals: Dict[str, float], start: Optional[str] = None,
+                      end: Optional[str] = None, window: int = 7, tolerance: float = 0.1) -> Dict[str, Any]:
+    """Trends and goal adherence for a user over [start, end] (default: the last year)"""
+    end = end or datetime.date.today().isoformat()
+    start = start or (datetime.date.fromisoformat(end) - datetime.timedelta(days=364)).isoformat()
+    span = (datetime.date.fromisoformat(end) - datetime.date.fromisoformat(start)).days
+    if span < 0:
+        raise ValueError("start must not be after end")
+    if span >= MAX_RANGE_DAYS:
+        raise ValueError(f"range must be shorter than {MAX_RANGE_DAYS} days")
+
+    series = load_daily_series(user_id, start, end)
+    goals = effective_goals(series.dates, get_user_goal_history(user_id), fallback_goals)
+    adh = adherence(series, goals, tolerance)
+    on_target = adh.pop("on_target")
+    rolling = np.round(rolling_mean(series, window), 1)
+
+    return {
+        "start": start,
+        "end": end,
+        "window": window,
+        "adherence": adh,
+        "streaks": {
+            "logging": runs(series.logged),
+            "on_target": runs(on_target),
+        },
+        "weekly": rollup(series, "week"),
+        "monthly": rollup(series, "month"),
+        "rolling": [
+            {"date": str(d), **dict(zip(MACROS, vals))}
+            for d, vals in zip(series.dates, rolling.tolist())
+        ],
+    }
@@ -0,0 +1,163 @@
+"""
+Password hashing, JWT tokens and the current-user dependency
+
+bcrypt runs on the thread pool so a login never blocks the event loop.
+Verified tokens and user rows are kept in LRU caches, so an authenticated
+request normally costs two dictionary lookups instead of a signature check
+and a database query.
+"""
+import hmac
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from jose import JWTError, jwt
+from passlib.context import CryptContext
+
+from database import get_user_by_email, get_user_by_id, create_user, set_user_password_hash
+
+JWT_ALGORITHM = "HS256"
+TOKEN_TTL_SECONDS = int(os.getenv("JWT_TTL_SECONDS", str(7 * 24 * 3600)))
+MIN_PASSWORD_LENGTH = 6
+
+JWT_SECRET = os.getenv("JWT_SECRET")
+if not JWT_SECRET:
+    # run.py exports one secret for all workers; this only covers running the app directly
+    JWT_SECRET = secrets.token_urlsafe(32)
+    print("JWT_SECRET not set; tokens will not survive a restart")
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+security = HTTPBearer()
+
+
+class _LRU:
+    """Small thread-safe LRU map"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+# token -> (user_id, exp); user_id -> {"user_id", "email"}
+_tokens = _LRU(int(os.getenv("AUTH_TOKEN_CACHE", "4096")))
+_users = _LRU(int(os.getenv("AUTH_USER_CACHE", "4096")))
+
+_UNAUTHORIZED = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Invalid or expired token",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+
+def issue_token(user_id: int, email: str) -> str:
+    exp = int(time.time()) + TOKEN_TTL_SECONDS
+    token = jwt.encode({"sub": str(user_id), "email": email, "exp": exp}, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    _tokens.put(token, (user_id, exp))
+    return token
+
+
+def authenticate(token: str) -> Dict[str, Any]:
+    """Resolve a bearer token to its user, raising 401 if it is invalid or expired"""
+    cached = _tokens.get(token)
+    if cached is None:
+        try:
+            claims = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            cached = (int(claims["sub"]), int(claims["exp"]))
+        except (JWTError, KeyError, ValueError):
+            raise _UNAUTHORIZED
+        _tokens.put(token, cached)
+    user_id, exp = cached
+    if exp <= time.time():
+        _tokens.pop(token)
+        raise _UNAUTHORIZED
+
+    user = _users.get(user_id)
+    if user is None:
+        row = get_user_by_id(user_id)
+        if row is None:
+            raise _UNAUTHORIZED
+        user = {"user_id": row["id"], "email": row["email"]}
+        _users.put(user_id, user)
+    return user
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
+    # async so the cached path runs inline instead of hopping to the thread pool
+    return authenticate(credentials.credentials)
+
+
+def forget_user(user_id: int):
+    """Drop a cached user row after it changes"""
+    _users.pop(user_id)
+
+
+def _check_password(password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """Return (valid, replacement_hash); blocking, run it on the thread pool"""
+    if stored is None:
+        # Same cost as a real check so unknown emails can't be told apart by timing
+        pwd_context.dummy_verify()
+        return False, None
+    if pwd_context.identify(stored, required=False) is None:
+        # Legacy plaintext row: accept once and upgrade it to bcrypt
+        if hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8")):
+            return True, pwd_context.hash(password)
+        return False, None
+    return pwd_context.verify_and_update(password, stored)
+
+
+def _normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+async def login_user(email: str, password: str) -> Dict[str, Any]:
+    user = get_user_by_email(_normalize_email(email))
+    valid, new_hash = await run_in_threadpool(_check_password, password, user["password_hash"] if user else None)
+    if not valid:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    if new_hash:
+        await run_in_threadpool(set_user_password_hash, user["id"], new_hash)
+        forget_user(user["id"])
+    return {"token": issue_token(user["id"], user["email"]), "user": {"id": user["id"], "email": user["email"]}}
+
+
+async def register_user(email: str, password: str) -> Dict[str, Any]:
+    email = _normalize_email(email)
+    if "@" not in email:
+        raise HTTPException(status_code=400, detail="Invalid email address")
+    if len(password) < MIN_PASSWORD_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Password must be at least {MIN_PASSWORD_LENGTH} characters")
+    if get_user_by_email(email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+    password_hash = await run_in_threadpool(pwd_context.hash, password)
+    try:
+        # through the writer this waits for a group commit; keep it off the event loop
+        user_id = await run_in_threadpool(create_user, email, password_hash)
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    return {"token": issue_token(user_id, email), "user": {"id": user_id, "email": email}}
@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the backend against generated temporary databases
+
+Usage: python benchmarks.py <name> [--days N] [--users N] [--rows N] [--foods PATH]
+                             [--fixture PATH] [--latency-scale X]
+"""
+import argparse
+import contextlib
+import datetime
+import multiprocessing
+import pathlib
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import database
+
+
+@contextlib.contextmanager
+def temp_database():
+    """Point the database module at a fresh schema in a temporary directory"""
+    original = database.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = pathlib.Path(tmp) / "bench.db"
+        try:
+            database.init_database()
+            yield database.DB_PATH
+        finally:
+            database.DB_PATH = original
+
+
+def generate_history(user_ids, days: int, items_per_day: int = 4, foods_per_user: int = 50, seed: int = 7):
+    """Fill the current database with foods, daily logs and some dated goals"""
+    rng = random.Random(seed)
+    end = datetime.date.today()
+    with database.get_connection() as conn:
+        for user_id in user_ids:
+            conn.execute("INSERT OR IGNORE INTO users (id, email, password_hash) VALUES (?, ?, 'x')",
+                         (user_id, f"user{user_id}@example.com"))
+            food_ids = []
+            for i in range(foods_per_user):
+                cur = conn.execute(
+                    """INSERT INTO foods (user_id, name, serving_desc, cal, protein, carbs, fat, provenance)
+                       VALUES (?, ?, '1 serving', ?, ?, ?, ?, 'seed')""",
+                    (user_id, f"food {i}", rng.uniform(50, 600), rng.uniform(0, 40),
+                     rng.uniform(0, 80), rng.uniform(0, 30)))
+                food_ids.append(cur.lastrowid)
+            conn.execute("INSERT INTO goals (user_id, goal_date, cal, protein, carbs, fat) VALUES (?, NULL, 2000, 150, 200, 80)",
+                         (user_id,))
+            # oldest first, the order a real history is written in
+            for d in reversed(range(days)):
+                day = (end - datetime.timedelta(days=d)).isoformat()
+                if rng.random() < 0.1:
+                    continue  # skipped day
+                log_id = conn.execute("INSERT INTO logs (user_id, log_date) VALUES (?, ?)", (user_id, day)).lastrowid
+                conn.executemany("INSERT INTO log_items (log_id, food_id, qty) VALUES (?, ?, ?)",
+                                 [(log_id, rng.choice(food_ids), rng.choice((0.5, 1, 1.5, 2)))
+                                  for _ in range(items_per_day)])
+                if d % 30 == 0:
+                    conn.execute("INSERT INTO goals (user_id, goal_date, cal, protein, carbs, fat) VALUES (?, ?, 1800, 160, 150, 60)",
+                                 (user_id, day))
+
+
+def _timed(fn, repeat: int = 5):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+# ---------- analytics ----------
+def _loop_adherence(user_id: int, start: str, end: str, fallback, tolerance: float = 0.1):
+    """Reference: one summary query and one goal lookup per calendar day"""
+    day = datetime.date.fromisoformat(start)
+    last = datetime.date.fromisoformat(end)
+    logged = on_target = 0
+    while day <= last:
+        s = database.get_user_daily_summary(user_id, day.isoformat())
+        with database.get_connection() as conn:
+            row = conn.execute("SELECT cal, protein FROM goals WHERE user_id = ? AND goal_date = ?",
+                               (user_id, day.isoformat())).fetchone()
+        goal = row or (fallback["calories"], fallback["protein_g"])
+        if s["cal"] or s["protein"]:
+            logged += 1
+            if abs(s["cal"] / goal[0] - 1) <= tolerance and s["protein"] >= (1 - tolerance) * goal[1]:
+                on_target += 1
+        day += datetime.timedelta(days=1)
+    return logged, on_target
+
+
+def bench_analytics(args):
+    from analytics import compute_analytics
+    fallback = {"calories": 2000, "protein_g": 150, "carbs_g": 200, "fat_g": 80}
+    with temp_database():
+        generate_history([1], args.days)
+        end = datetime.date.today()
+        start = (end - datetime.timedelta(days=args.days - 1)).isoformat()
+        end = end.isoformat()
+
+        vec_s, result = _timed(lambda: compute_analytics(1, fallback, start, end))
+        loop_s, (logged, on_target) = _timed(lambda: _loop_adherence(1, start, end, fallback), repeat=1)
+
+    adh = result["adherence"]
+    assert (adh["days_logged"], adh["days_on_target"]) == (logged, on_target), "results differ"
+    print(f"analytics over {args.days} days ({logged} logged)")
+    print(f"  vectorized: {vec_s * 1000:8.2f} ms (rollups, rolling means, adherence, streaks)")
+    print(f"  per-day loop: {loop_s * 1000:6.2f} ms (adherence only)")
+    print(f"  speedup: {loop_s / vec_s:.1f}x")
+
+
+# ---------- export ----------
+def _export_profile(days: int, items_per_day: int, fmt: str):
+    from export import export_user_logs
+    with temp_database():
+        generate_history([1], days, items_per_day=items_per_day)
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        first_chunk_s = None
+        total = 0
+        for chunk in export_user_logs(1, fmt):
+            if first_chunk_s is None:
+                first_chunk_s = time.perf_counter() - t0
+            total += len(chunk)
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return days * items_per_day, total, peak, first_chunk_s, elapsed
+
+
+def bench_export(args):
+    for fmt in ("ndjson", "csv"):
+        results = [_export_profile(args.days, n, fmt) for n in (5, 100)]
+        for items, total, peak, first_s, elapsed in results:
+            print(f"{fmt:6} ~{items:>7} items: {total / 1e6:7.1f} MB in {elapsed:6.2f} s, "
+                  f"first chunk after {first_s * 1000:6.1f} ms, peak Python memory {peak / 1024:7.0f} KiB")
+        small_peak, large_peak = results[0][2], results[1][2]
+        # 20x the rows must not cost more than a small constant on top of the fixed buffers
+        assert large_peak < small_peak * 1.5 + 256 * 1024, f"{fmt} export memory grew with history size"
+    print("memory stays bounded")
+
+
+# ---------- import ----------
+def bench_import(args):
+    from importer import import_foods
+    rows = args.rows
+    rng = random.Random(11)
+    with temp_database() as db_path:
+        csv_path = db_path.parent / "foods.csv"
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write("name,serving_desc,cal,protein,carbs,fat\n")
+            for i in range(rows):
+                cal = -1 if i % 1000 == 0 else round(rng.uniform(0, 900), 1)  # 0.1% invalid
+                f.write(f"reference food {i},100 g,{cal},{rng.uniform(0, 40):.1f},"
+                        f"{rng.uniform(0, 90):.1f},{rng.uniform(0, 50):.1f}\n")
+        for label in ("insert", "upsert"):
+            with open(csv_path, encoding="utf-8", newline="") as f:
+                report = import_foods(f, "csv", 1)
+            print(f"{label}: {report['imported']} imported, {report['rejected']} rejected "
+                  f"in {report['seconds']} s ({report['rows_per_sec']} rows/s)")
+
+
+# ---------- food listing ----------
+def _foods_page_profile(catalog: int, limit: int = 100):
+    """(first page s, deep page s, page peak bytes, full listing s) for a catalog of that size"""
+    with temp_database():
+        generate_history([1], 1, foods_per_user=50)
+        with database.get_connection() as conn:
+            conn.executemany(
+                "INSERT INTO foods (user_id, name, serving_desc, cal, protein, carbs, fat, provenance) "
+                "VALUES (NULL, ?, '100 g', 100, 10, 10, 5, 'catalog')",
+                ((f"catalog food {i:07d}",) for i in range(catalog)))
+        deep = f"catalog food {catalog // 2:07d}"
+        first_s, _ = _timed(lambda: database.get_user_foods_page(1, limit=limit))
+        deep_s, _ = _timed(lambda: database.get_user_foods_page(1, after=deep, limit=limit))
+        tracemalloc.start()
+        database.get_user_foods_page(1, after=deep, limit=limit)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        full_s, _ = _timed(lambda: database.get_user_foods(1), repeat=1)
+    return first_s, deep_s, peak, full_s
+
+
+def bench_foods(args):
+    sizes = sorted({100, 10000, args.rows})
+    results = {n: _foods_page_profile(n) for n in sizes}
+    print("catalog size: first page / page from the middle / page peak memory / old full listing")
+    for n, (first_s, deep_s, peak, full_s) in results.items():
+        print(f"  {n:>9}: {first_s * 1000:6.2f} ms / {deep_s * 1000:6.2f} ms / "
+              f"{peak / 1024:6.0f} KiB / {full_s * 1000:9.1f} ms")
+    small, large = results[sizes[0]], results[sizes[-1]]
+    assert large[2] < small[2] * 1.5 + 64 * 1024, "page memory grew with catalog size"
+    print("page cost stays flat")
+
+
+# ---------- writer ----------
+def _write_worker(db_path, socket_path, shards, user_id, writes, out):
+    database.DB_PATH = db_path
+    database.WRITER_SOCKET = socket_path
+    database.SHARDS = shards
+    food_id = database.lookup_food_id(user_id, "food 0")
+    errors = 0
+    latencies = []
+    for i in range(writes):
+        t0 = time.perf_counter()
+        try:
+            database.insert_user_log_items(user_id, "2025-01-01", [(food_id, 1)])
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - t0)
+    out.put((errors, latencies))
+
+
+def _run_writers(db_path, socket_path, procs: int, writes: int, shards: int = 0):
+    out = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_write_worker, args=(db_path, socket_path, shards, u, writes, out))
+               for u in range(1, procs + 1)]
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    errors, latencies = 0, []
+    for _ in workers:
+        e, l = out.get()
+        errors += e
+        latencies.extend(l)
+    for w in workers:
+        w.join()
+    latencies.sort()
+    return time.perf_counter() - t0, errors, latencies
+
+
+def _percentile_ms(sorted_values, pct: float) -> float:
+    return sorted_values[min(int(len(sorted_values) * pct), len(sorted_values) - 1)] * 1000
+
+
+def bench_writer(args):
+    from run import start_writer
+    procs, writes = args.users, 200
+    with temp_database() as db_path:
+        generate_history(range(1, procs + 1), 1)
+        with database.get_connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            before = conn.execute("SELECT COUNT(*) FROM log_items").fetchone()[0]
+
+        direct_s, direct_err, _ = _run_writers(db_path, None, procs, writes)
+
+        socket_path = str(db_path.parent / "writer.sock")
+        writer = start_writer(socket_path)
+        try:
+            grouped_s, grouped_err, _ = _run_writers(db_path, socket_path, procs, writes)
+            from writer import WriterClient
+            stats = WriterClient(socket_path).stats()
+        finally:
+            writer.terminate()
+
+        with database.get_connection() as conn:
+            after = conn.execute("SELECT COUNT(*) FROM log_items").fetchone()[0]
+
+    total = procs * writes
+    assert after - before == 2 * total - direct_err - grouped_err, "lost writes"
+    print(f"{procs} processes x {writes} meal logs")
+    print(f"  direct connections: {total / direct_s:8.0f} writes/s ({direct_err} failed)")
+    print(f"  single writer:      {total / grouped_s:8.0f} writes/s ({grouped_err} failed, "
+          f"{stats['units'] / max(stats['groups'], 1):.1f} units per commit)")
+
+
+# ---------- shards ----------
+def bench_shards(args):
+    procs, writes = args.users, 200
+    original_dir = database.SHARD_DIR
+    with temp_database() as db_path:
+        database.SHARD_DIR = db_path.parent / "shards"
+        try:
+            generate_history(range(1, procs + 1), 1)
+            results = {}
+            for shards in (0, procs):
+                database.SHARDS = shards
+                if shards:
+                    for u in range(1, procs + 1):
+                        database.add_user_food(u, "food 0", "1 serving", 100, 10, 10, 5)
+                results[shards] = _run_writers(db_path, None, procs, writes, shards)
+        finally:
+            database.SHARDS = 0
+            database.SHARD_DIR = original_dir
+
+    total = procs * writes
+    print(f"{procs} users writing concurrently, {writes} meal logs each, direct connections")
+    for shards, (seconds, errors, latencies) in results.items():
+        label = "single file" if not shards else f"{shards} shards"
+        print(f"  {label:12}: {total / seconds:8.0f} writes/s, latency p50 {_percentile_ms(latencies, 0.5):6.2f} ms "
+              f"p99 {_percentile_ms(latencies, 0.99):7.2f} ms ({errors} failed)")
+
+
+# ---------- compaction ----------
+def _same_totals(a, b, rel: float = 1e-9) -> bool:
+    return len(a) == len(b) and all(abs(x - y) <= rel * max(1.0, abs(x)) for x, y in zip(a, b))
+
+
+def bench_compact(args):
+    from compaction import compact_logs
+    retention = 30
+    users = range(1, args.users + 1)
+    today = datetime.date.today()
+    days = [(today - datetime.timedelta(days=d)).isoformat() for d in range(args.days)]
+
+    def summaries():
+        return [v for u in users for d in days
+                for k, v in database.get_user_daily_summary(u, d).items() if k != "date"]
+
+    def totals():
+        return [v for u in users for row in database.get_user_daily_totals(u, days[-1], days[0]) for v in row[1:]]
+
+    def item_rows():
+        with database.get_connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM log_items").fetchone()[0]
+
+    with temp_database() as db_path:
+        # three meals a day drawn from a short list of staples, so foods repeat within a day
+        generate_history(users, args.days, items_per_day=12, foods_per_user=8)
+        rows_before = item_rows()
+        sum_before_s, sum_before = _timed(summaries, repeat=3)
+        tot_before_s, tot_before = _timed(totals)
+        report = compact_logs(retention)
+        rows_after = item_rows()
+        sum_after_s, sum_after = _timed(summaries, repeat=3)
+        tot_after_s, tot_after = _timed(totals)
+        size_mb = db_path.stat().st_size / 1e6
+
+    assert _same_totals(sum_before, sum_after) and _same_totals(tot_before, tot_after), "totals changed"
+    print(f"compaction of {args.users} users x {args.days} days, keeping the last {retention} days as logged")
+    print(f"  log_items: {rows_before} -> {rows_after} rows ({report['rows_removed']} removed) in {report['seconds']}s")
+    print(f"  reclaimed: {report['bytes_reclaimed'] / 1e6:.2f} MB (file now {size_mb:.2f} MB)")
+    print(f"  daily summaries ({len(days) * args.users} queries): {sum_before_s * 1000:8.1f} -> {sum_after_s * 1000:8.1f} ms "
+          f"({sum_before_s / sum_after_s:.2f}x)")
+    print(f"  range totals ({args.users} queries): {tot_before_s * 1000:8.1f} -> {tot_after_s * 1000:8.1f} ms "
+          f"({tot_before_s / tot_after_s:.2f}x)")
+    print("  totals unchanged")
+
+
+# ---------- local estimator ----------
+def _reference_rows(path):
+    """Valid foods from a CSV/NDJSON file, else from the current database"""
+    if path:
+        sys.path.append('..')
+        from app.validator import validate_food_args
+        from importer import _iter_records, format_for
+        with open(path, encoding="utf-8", newline="") as f:
+            return [r for _, r in _iter_records(f, format_for(path))
+                    if isinstance(r, dict) and not validate_food_args(r)]
+    return database.get_reference_foods()
+
+
+def bench_estimator(args):
+    """Leave-one-out: estimate every known food from the others, as if it were unknown"""
+    sys.path.append('..')
+    from app.estimator import FoodIndex, MACROS
+    index = FoodIndex(_reference_rows(args.foods))
+    rows = index.foods
+    if len(rows) < 2:
+        print("Need at least two reference foods")
+        return
+    started = time.perf_counter()
+    results = []  # (confidence, {macro: absolute error})
+    for i, row in enumerate(index.foods):
+        est = index.estimate(row["name"], exclude=i)
+        if est is not None:
+            results.append((est.confidence, {m: abs(est.macros[m] - float(row[m])) for m in MACROS}))
+    per_lookup_ms = (time.perf_counter() - started) * 1000 / len(rows)
+
+    fixed = {"cal": 100, "protein": 5, "carbs": 5, "fat": 3}  # what the offline fallback returns
+    baseline = {m: sum(abs(fixed[m] - float(r[m])) for r in rows) / len(rows) for m in MACROS}
+    print(f"{len(rows)} reference foods, {per_lookup_ms:.3f} ms per estimate")
+    print(f"  fixed fallback  : MAE " + " ".join(f"{m} {baseline[m]:6.1f}" for m in MACROS))
+    for threshold in (0.3, 0.4, 0.5, 0.6, 0.7, 0.8):
+        accepted = [err for conf, err in results if conf >= threshold]
+        avoided = len(accepted) / len(rows)
+        if not accepted:
+            print(f"  confidence>={threshold:.1f}: no local estimates, every food goes to the LLM")
+            continue
+        mae = {m: sum(e[m] for e in accepted) / len(accepted) for m in MACROS}
+        print(f"  confidence>={threshold:.1f}: {avoided:6.1%} LLM calls avoided, MAE "
+              + " ".join(f"{m} {mae[m]:6.1f}" for m in MACROS))
+
+
+# ---------- LLM replay ----------
+_CHAT_MESSAGES = ["log 2 egg", "log 1 rice", "add 1 banana", "show today totals",
+                  "set goal 1800 140 170 60", "log 3 bread", "hello coach"]
+
+
+def _synthetic_fixture(path, median_s: float = 0.8, seed: int = 3):
+    """Offline-backend chat replies with a lognormal latency profile, for when nothing was recorded"""
+    import json
+    import math
+    from app import llm
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for message in _CHAT_MESSAGES:
+            history = [{"role": "user", "content": message}]
+            for _ in range(5):
+                f.write(json.dumps({"kind": "chat", "key": llm._prompt_key("chat", history), "backend": "offline",
+                                    "prompt": history, "reply": llm._offline_chat(history),
+                                    "latency": round(rng.lognormvariate(math.log(median_s), 0.5), 4)}) + "\n")
+
+
+async def _chat_load(app, token: str, concurrency: int, requests: int):
+    import httpx
+    latencies, failures = [], 0
+    queue = list(range(requests))
+
+    async def client_loop(client):
+        nonlocal failures
+        while queue:
+            i = queue.pop()
+            message = _CHAT_MESSAGES[i % len(_CHAT_MESSAGES)]
+            t0 = time.perf_counter()
+            r = await client.post("/api/chat", json={"message": message, "history": []},
+                                  headers={"Authorization": f"Bearer {token}"})
+            latencies.append(time.perf_counter() - t0)
+            failures += r.status_code != 200
+
+    import asyncio
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        return time.perf_counter() - started, sorted(latencies), failures
+
+
+def bench_llm(args):
+    """Load-test /api/chat (parse_turn, validation, SQL actions) against replayed model replies"""
+    import asyncio
+    sys.path.append('..')
+    from app import llm
+    with temp_database() as db_path:
+        fixture = args.fixture
+        if not fixture:
+            fixture = str(db_path.parent / "chat_fixture.jsonl")
+            _synthetic_fixture(fixture)
+        import main
+        from auth import issue_token
+        llm.BACKEND = "replay"
+        token = issue_token(1, "demo@example.com")
+        requests = 50
+        print(f"/api/chat, {requests} requests, replaying {fixture} at {args.latency_scale}x latency")
+        for concurrency in sorted({1, args.users}):
+            llm._replayer = llm.Replayer(fixture, args.latency_scale)
+            seconds, latencies, failures = asyncio.run(_chat_load(main.app, token, concurrency, requests))
+            stats = llm._replayer.stats()
+            print(f"  {concurrency:3} clients: {requests / seconds:7.1f} req/s, p50 {_percentile_ms(latencies, 0.5):7.1f} ms "
+                  f"p99 {_percentile_ms(latencies, 0.99):7.1f} ms, {failures} failed, "
+                  f"replay hits {stats['hits']} misses {stats['misses']}")
+
+
+BENCHMARKS = {
+    "analytics": bench_analytics,
+    "export": bench_export,
+    "foods": bench_foods,
+    "llm": bench_llm,
+    "import": bench_import,
+    "writer": bench_writer,
+    "shards": bench_shards,
+    "estimator": bench_estimator,
+    "compact": bench_compact,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("name", choices=sorted(BENCHMARKS))
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--foods", help="estimator: CSV/NDJSON reference foods instead of the database")
+    parser.add_argument("--fixture", help="llm: recorded LLM_RECORD fixture (default: synthetic offline replies)")
+    parser.add_argument("--latency-scale", type=float, default=0.1, help="llm: multiplier on recorded latencies")
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
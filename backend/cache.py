@@ -0,0 +1,132 @@
+"""
+Per-user response cache with strong ETags for read endpoints
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional
+
+try:
+    import orjson
+except ImportError:  # optional: several times faster on large list responses
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    """Compact JSON bytes, through orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+class CachedResponse(NamedTuple):
+    etag: str
+    body: bytes
+
+
+class ResponseCache:
+    """LRU cache of serialized JSON responses keyed by (user_id, resource, params).
+
+    Write paths call ``invalidate`` for the resources they touch, so entries
+    never need a TTL: an entry is valid until the underlying data changes.
+    When other processes write too, set ``version_fn`` to a cheap per-user
+    database change counter; a user's entries are dropped whenever it moves.
+    A response computed while an invalidation ran is returned but not stored.
+    """
+
+    def __init__(self, max_entries: int = 2048, version_fn: Optional[Callable[[int], Hashable]] = None):
+        self.max_entries = max_entries
+        self.version_fn = version_fn
+        self._versions: Dict[int, Hashable] = {}
+        # bumped by every invalidation, per user and for all users
+        self._generations: Dict[int, int] = defaultdict(int)
+        self._generation = 0
+        self._entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, user_id: int, resource: str, params: Hashable,
+                       compute: Callable[[], Any]) -> CachedResponse:
+        """Return the cached response, computing and storing it on a miss"""
+        key = (user_id, resource, params)
+        version = self.version_fn(user_id) if self.version_fn else None
+        with self._lock:
+            if self._versions.get(user_id) != version:
+                self._drop(lambda k: k[0] == user_id)
+                self._versions[user_id] = version
+                self._generations[user_id] += 1
+            generation = (self._generation, self._generations[user_id])
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        body = dumps(compute())
+        entry = CachedResponse(f'"{hashlib.sha256(body).hexdigest()[:32]}"', body)
+        with self._lock:
+            if generation != (self._generation, self._generations[user_id]):
+                # invalidated while computing: the body may predate the change
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _drop(self, stale: Callable[[tuple], bool]):
+        for k in [k for k in self._entries if stale(k)]:
+            del self._entries[k]
+
+    def invalidate(self, user_id: int, *resources: str):
+        """Drop a user's cached entries for the given resources (all if none given)"""
+        with self._lock:
+            self._drop(lambda k: k[0] == user_id and (not resources or k[1] in resources))
+            self._generations[user_id] += 1
+            self.invalidations += 1
+
+    def invalidate_all(self, *resources: str):
+        """Drop every user's cached entries for the given resources (e.g. shared catalog changes)"""
+        with self._lock:
+            self._drop(lambda k: k[1] in resources)
+            self._generation += 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.invalidations += 1
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Strong comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+response_cache = ResponseCache()
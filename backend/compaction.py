@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Retention compaction of old meal logs
+
+Past the retention horizon nobody needs to know that one egg was logged at
+breakfast and two more at lunch: on days older than the horizon, a food
+logged more than once is folded into one row with the quantities summed.
+Daily summaries and analytics sum food macros times qty, so their totals
+don't change; exports list the folded rows. Freed pages are then given back
+to the file system with incremental vacuum.
+
+Usage: python compaction.py [--days N] [--no-vacuum]
+"""
+import argparse
+import datetime
+import os
+import pathlib
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+import database
+from database import execute_write
+
+RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "90"))
+# Logs folded per write unit, so the writer is never held for long
+BATCH_LOGS = 500
+
+# Old logs in one batch of log ids, and those of them with a food logged more than once.
+# Only rows that existed when the run started (id <= :max_id) are folded.
+_OLD_LOGS = "SELECT id FROM logs WHERE id BETWEEN :lo AND :hi AND log_date < :before"
+_REPEATS = f"""SELECT log_id FROM log_items WHERE id <= :max_id AND log_id IN ({_OLD_LOGS})
+               GROUP BY log_id, food_id HAVING COUNT(*) > 1"""
+
+# Rollup rows are appended, so they land together on fresh pages...
+_ROLLUP_SQL = f"""
+    INSERT INTO log_items (log_id, food_id, qty)
+    SELECT log_id, food_id, SUM(qty) FROM log_items
+    WHERE id <= :max_id AND log_id IN ({_REPEATS})
+    GROUP BY log_id, food_id ORDER BY log_id, food_id
+"""
+
+# ...and the rows they replace are deleted, emptying whole pages of old history
+_DROP_SQL = f"DELETE FROM log_items WHERE id <= :max_id AND log_id IN ({_REPEATS})"
+
+_COUNT_SQL = f"SELECT changes(), (SELECT COUNT(*) FROM log_items WHERE id > :max_id AND log_id IN ({_OLD_LOGS}))"
+
+
+def _open(path: pathlib.Path) -> sqlite3.Connection:
+    return database.get_connection() if path == database.DB_PATH else database.open_shard(path)
+
+
+def _databases() -> List[tuple]:
+    """(user_id routing to it, path) for the main database and every shard file"""
+    targets = [(None, database.DB_PATH)]
+    for shard in range(database.SHARDS):
+        if database.shard_path(shard).exists():
+            # user id k always routes to shard k
+            targets.append((shard, database.shard_path(shard)))
+    return targets
+
+
+def _page_count(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA page_count").fetchone()[0]
+
+
+def reclaim_space(conn: sqlite3.Connection) -> int:
+    """Return free pages to the file system; returns the number of pages released.
+
+    A database file created before init_database enabled auto_vacuum gets
+    one full VACUUM to switch it over.
+    """
+    before = _page_count(conn)
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    # frees one page per step; execute() steps once, executescript() runs it to completion
+    conn.executescript("PRAGMA incremental_vacuum;")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    # switching a small file over can add pointer-map pages
+    return max(0, before - _page_count(conn))
+
+
+def compact_database(user_id: Optional[int], path: pathlib.Path, before: str, vacuum: bool = True) -> Dict[str, Any]:
+    """Fold log items dated before ``before`` in one database file"""
+    conn = _open(path)
+    try:
+        log_ids = [r[0] for r in conn.execute("SELECT id FROM logs WHERE log_date < ? ORDER BY id", (before,))]
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM log_items").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        conn.close()
+
+    deleted = written = 0
+    for i in range(0, len(log_ids), BATCH_LOGS):
+        params = {"lo": log_ids[i], "hi": log_ids[min(i + BATCH_LOGS, len(log_ids)) - 1],
+                  "before": before, "max_id": max_id}
+        # one write unit: totals never see rollups and originals at once
+        result = execute_write([{"sql": sql, "params": params} for sql in (_ROLLUP_SQL, _DROP_SQL, _COUNT_SQL)],
+                               fetch=True, user_id=user_id)
+        batch_deleted, batch_written = result["rows"][0]
+        deleted += batch_deleted
+        written += batch_written
+    removed = deleted - written
+
+    released = 0
+    if vacuum and removed:
+        conn = sqlite3.connect(path, isolation_level=None)
+        try:
+            released = reclaim_space(conn)
+        finally:
+            conn.close()
+    return {"database": path.name, "old_logs": len(log_ids), "rollup_rows": written,
+            "rows_removed": removed, "bytes_reclaimed": released * page_size}
+
+
+def compact_logs(days: int = RETENTION_DAYS, before: Optional[str] = None, vacuum: bool = True) -> Dict[str, Any]:
+    """Compact every database; ``before`` (YYYY-MM-DD) overrides the ``days`` horizon"""
+    before = before or (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
+    started = time.perf_counter()
+    reports = [compact_database(user_id, path, before, vacuum) for user_id, path in _databases()]
+    return {
+        "before": before,
+        "rows_removed": sum(r["rows_removed"] for r in reports),
+        "bytes_reclaimed": sum(r["bytes_reclaimed"] for r in reports),
+        "seconds": round(time.perf_counter() - started, 3),
+        "databases": reports,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold old log items into one row per day and food")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="keep this many recent days as logged")
+    parser.add_argument("--no-vacuum", dest="vacuum", action="store_false")
+    args = parser.parse_args()
+
+    report = compact_logs(args.days, vacuum=args.vacuum)
+    print(f"Compacted logs before {report['before']}: {report['rows_removed']} rows removed, "
+          f"{report['bytes_reclaimed'] / 1e6:.1f} MB reclaimed in {report['seconds']}s")
+    for r in report["databases"]:
+        if r["rows_removed"]:
+            print(f"  {r['database']}: {r['old_logs']} days, {r['rollup_rows']} rollup rows, "
+                  f"{r['rows_removed']} removed, {r['bytes_reclaimed'] / 1e6:.1f} MB")
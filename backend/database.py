@@ -1,60 +1,462 @@
 """
 Database utilities for FastAPI backend
 """
+import contextlib
+import os
 import sqlite3
+import threading
 import pathlib
-from typing import Optional, List, Dict, Any
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 
 # Database path
 BASE = pathlib.Path(__file__).resolve().parents[1]
 DB_PATH = BASE / "db" / "tracker.db"
 SCHEMA = pathlib.Path(__file__).parent / "schema.sql"
 
-def get_connection():
+# Sharding: with TRACKER_SHARDS=N, each user's foods, logs and goals live in
+# shard file user_id % N; users and the global food catalog stay in DB_PATH.
+SHARDS = int(os.getenv("TRACKER_SHARDS", "0"))
+SHARD_DIR = pathlib.Path(os.getenv("TRACKER_SHARD_DIR", str(BASE / "db" / "shards")))
+SHARD_SCHEMA = pathlib.Path(__file__).parent / "shard_schema.sql"
+# Open connections kept per process, for reads and for writes each
+MAX_OPEN_SHARDS = int(os.getenv("TRACKER_MAX_OPEN_SHARDS", "64"))
+_ready_shards = set()
+
+# When set, writes are sent to the single writer process (see writer.py)
+WRITER_SOCKET = os.getenv("TRACKER_WRITER_SOCKET")
+_writer_client = None
+_version_conn = None
+_version_lock = threading.Lock()
+
+def get_connection(check_same_thread: bool = True):
     """Get database connection with foreign keys enabled"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=check_same_thread)
     conn.execute("PRAGMA foreign_keys=ON;")
     return conn
 
+def _run_schema(conn: sqlite3.Connection, schema: pathlib.Path):
+    sql = schema.read_text(encoding="utf-8")
+    for stmt in [s.strip() + ";" for s in sql.split(";") if s.strip()]:
+        conn.execute(stmt)
+
 def init_database():
     """Initialize database with updated schema"""
-    sql = SCHEMA.read_text(encoding="utf-8")
     with get_connection() as conn:
-        for stmt in [s.strip() + ";" for s in sql.split(";") if s.strip()]:
-            conn.execute(stmt)
+        # Only applies to a new file and must come before WAL; compaction.py converts older files
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        # WAL lets readers run while the writer commits
+        conn.execute("PRAGMA journal_mode=WAL;")
+        _run_schema(conn, SCHEMA)
 
-def get_user_foods(user_id: int, search: Optional[str] = None) -> List[Dict[str, Any]]:
-    """Get foods for a specific user"""
+# ---------- shard routing ----------
+def shard_path(user_id: Optional[int]) -> pathlib.Path:
+    """Database file holding a user's data; None (shared data) maps to DB_PATH"""
+    if not SHARDS or user_id is None:
+        return DB_PATH
+    return SHARD_DIR / f"shard_{int(user_id) % SHARDS:04d}.db"
+
+def open_shard(path: pathlib.Path, check_same_thread: bool = True) -> sqlite3.Connection:
+    """Connect to a shard file, creating its schema on first use in this process"""
+    if path not in _ready_shards:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA foreign_keys=ON;")
+    if path not in _ready_shards:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        conn.execute("PRAGMA journal_mode=WAL;")
+        _run_schema(conn, SHARD_SCHEMA)
+        conn.commit()
+        _ready_shards.add(path)
+    return conn
+
+class ShardConnectionCache:
+    """Process-wide pool of open read connections to shard files.
+
+    A connection is lent to one thread at a time and kept open when it comes
+    back; once more than ``max_open`` are open, the least recently used idle
+    ones are closed. With every connection lent out, another is opened and
+    closed again on return, so idle connections never exceed ``max_open``.
+    Shard connections attach DB_PATH as ``shared`` for the global catalog.
+    """
+
+    def __init__(self, max_open: int):
+        self.max_open = max_open
+        self._idle: "OrderedDict[pathlib.Path, List[sqlite3.Connection]]" = OrderedDict()
+        self._open = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _connect(self, path: pathlib.Path) -> sqlite3.Connection:
+        conn = open_shard(path, check_same_thread=False)
+        conn.execute("ATTACH DATABASE ? AS shared", (str(DB_PATH),))
+        return conn
+
+    @contextlib.contextmanager
+    def acquire(self, path: pathlib.Path) -> Iterator[sqlite3.Connection]:
+        conn = None
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked child: the parent's connections must not be shared
+                self._idle, self._open, self._pid = OrderedDict(), 0, os.getpid()
+            idle = self._idle.get(path)
+            if idle:
+                conn = idle.pop()
+                if not idle:
+                    del self._idle[path]
+            else:
+                self._open += 1
+        if conn is None:
+            try:
+                conn = self._connect(path)
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                raise
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._release(path, conn)
+
+    def _release(self, path: pathlib.Path, conn: sqlite3.Connection):
+        with self._lock:
+            self._idle.setdefault(path, []).append(conn)
+            self._idle.move_to_end(path)
+            while self._open > self.max_open and self._idle:
+                lru, conns = next(iter(self._idle.items()))
+                conns.pop(0).close()
+                self._open -= 1
+                if not conns:
+                    del self._idle[lru]
+
+    def open_count(self) -> int:
+        return self._open
+
+shard_connections = ShardConnectionCache(MAX_OPEN_SHARDS)
+
+class WriteConnectionCache:
+    """Bounded LRU of open write connections, one per database file.
+
+    Reconnecting for every write unit costs a connect plus schema setup, and
+    closing the last connection to a file checkpoints its WAL. A connection
+    is used by one thread at a time under its own lock; idle ones are closed
+    once more than ``max_open`` files have been written to.
+    """
+
+    def __init__(self, max_open: int):
+        self.max_open = max_open
+        self._conns: "OrderedDict[pathlib.Path, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _open(self, path: pathlib.Path) -> sqlite3.Connection:
+        conn = (get_connection(check_same_thread=False) if path == DB_PATH
+                else open_shard(path, check_same_thread=False))
+        conn.isolation_level = None
+        return conn
+
+    @contextlib.contextmanager
+    def acquire(self, path: pathlib.Path) -> Iterator[sqlite3.Connection]:
+        while True:
+            with self._lock:
+                if self._pid != os.getpid():
+                    # forked child: the parent's connections must not be shared
+                    self._conns, self._pid = OrderedDict(), os.getpid()
+                entry = self._conns.get(path)
+                if entry is None:
+                    entry = self._conns[path] = (self._open(path), threading.Lock())
+                    self._evict()
+                self._conns.move_to_end(path)
+            conn, lock = entry
+            with lock:
+                # evicted between lookup and lock: look it up again
+                if self._conns.get(path) is entry:
+                    yield conn
+                    return
+
+    def _evict(self):
+        for path in list(self._conns):
+            if len(self._conns) <= self.max_open:
+                break
+            conn, lock = self._conns[path]
+            if lock.acquire(blocking=False):
+                del self._conns[path]
+                conn.close()
+                lock.release()
+
+write_connections = WriteConnectionCache(MAX_OPEN_SHARDS)
+
+def get_user_connection(user_id: int):
+    """Read connection for a user's data, for use in a ``with`` block
+    (a pooled shard connection when sharded)"""
+    if not SHARDS:
+        return get_connection()
+    return shard_connections.acquire(shard_path(user_id))
+
+def _catalog() -> str:
+    """Schema name that holds the global catalog on a user connection"""
+    return "shared" if SHARDS else "main"
+
+# Change counter scopes: the shared catalog, or else the user with that id
+CATALOG_SCOPE = 0
+_BUMP_SQL = """INSERT INTO change_counters (scope, version) VALUES (?, 1)
+               ON CONFLICT(scope) DO UPDATE SET version = version + 1"""
+
+def _counters(conn: sqlite3.Connection, user_id: Optional[int]) -> Tuple[int, int]:
+    found = dict(conn.execute("SELECT scope, version FROM main.change_counters WHERE scope IN (?, ?)",
+                              (CATALOG_SCOPE, user_id)).fetchall())
+    return found.get(CATALOG_SCOPE, 0), found.get(user_id, 0)
+
+def data_version(user_id: Optional[int] = None) -> tuple:
+    """Changes whenever a write unit commits to the user's data or the shared catalog.
+
+    Reads the counters execute_write bumps, so other users' commits and job
+    bookkeeping leave it alone. Writes that bypass execute_write are not seen.
+    """
+    global _version_conn
+    with _version_lock:
+        if _version_conn is None:
+            _version_conn = get_connection(check_same_thread=False)
+        catalog, own = _counters(_version_conn, user_id)
+    if SHARDS and user_id is not None:
+        # the user's data and their pinned copies of catalog foods live in the shard
+        with get_user_connection(user_id) as conn:
+            return (catalog,) + _counters(conn, user_id)
+    return catalog, own
+
+# ---------- writes ----------
+def apply_write(conn: sqlite3.Connection, statements: List[Dict[str, Any]], fetch: bool = False) -> Dict[str, Any]:
+    """Apply one write unit inside the caller's transaction, all or nothing.
+
+    Each statement is {"sql": ..., "params": [...]} or {"sql": ..., "many": [[...], ...]};
+    ``fetch`` returns the rows of the last statement (e.g. from RETURNING).
+    """
+    conn.execute("SAVEPOINT write_unit")
+    try:
+        cursor = None
+        for stmt in statements:
+            if "many" in stmt:
+                cursor = conn.executemany(stmt["sql"], stmt["many"])
+            else:
+                cursor = conn.execute(stmt["sql"], stmt.get("params", ()))
+        rows = [list(r) for r in cursor.fetchall()] if fetch and cursor else []
+    except Exception:
+        # not only sqlite3.Error: e.g. an int too large to bind raises OverflowError
+        conn.execute("ROLLBACK TO write_unit")
+        conn.execute("RELEASE write_unit")
+        raise
+    conn.execute("RELEASE write_unit")
+    return {"lastrowid": cursor.lastrowid if cursor else None,
+            "rowcount": cursor.rowcount if cursor else 0,
+            "rows": rows}
+
+def execute_write(statements: List[Dict[str, Any]], fetch: bool = False,
+                  user_id: Optional[int] = None, catalog: bool = False) -> Dict[str, Any]:
+    """Run a write unit against the user's shard (or shared data when user_id is None),
+    through the writer process when one is configured.
+
+    The unit also bumps the user's change counter, and the shared catalog's
+    when ``catalog`` is set, so data_version moves exactly with it.
+    """
+    global _writer_client
+    scopes = ([CATALOG_SCOPE] if catalog else []) + ([user_id] if user_id is not None else [])
+    if scopes:
+        # first, so the unit's result is still that of its last statement
+        statements = [{"sql": _BUMP_SQL, "many": [[scope] for scope in scopes]}] + statements
+    if WRITER_SOCKET:
+        if _writer_client is None:
+            from writer import WriterClient
+            _writer_client = WriterClient(WRITER_SOCKET)
+        return _writer_client.execute(statements, fetch, user_id)
+
+    with write_connections.acquire(shard_path(user_id)) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = apply_write(conn, statements, fetch)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+# ---------- foods ----------
+# ---------- users (always in the main database) ----------
+def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
+    """User row including the stored password hash, for login"""
     with get_connection() as conn:
-        if search:
-            cursor = conn.execute(
-                "SELECT id, name, serving_desc, cal, protein, carbs, fat, provenance FROM foods WHERE user_id = ? AND name LIKE ?",
-                (user_id, f"%{search}%")
-            )
-        else:
-            cursor = conn.execute(
-                "SELECT id, name, serving_desc, cal, protein, carbs, fat, provenance FROM foods WHERE user_id = ?",
-                (user_id,)
-            )
+        row = conn.execute(
+            "SELECT id, email, password_hash FROM users WHERE email = ?", (email,)
+        ).fetchone()
+    return {"id": row[0], "email": row[1], "password_hash": row[2]} if row else None
+
+def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
+    with get_connection() as conn:
+        row = conn.execute("SELECT id, email FROM users WHERE id = ?", (user_id,)).fetchone()
+    return {"id": row[0], "email": row[1]} if row else None
+
+def create_user(email: str, password_hash: str) -> int:
+    """Insert a user; raises sqlite3.IntegrityError if the email is taken"""
+    result = execute_write([{
+        "sql": "INSERT INTO users (email, password_hash) VALUES (?, ?)",
+        "params": [email, password_hash]
+    }])
+    return result["lastrowid"]
+
+def set_user_password_hash(user_id: int, password_hash: str):
+    execute_write([{
+        "sql": "UPDATE users SET password_hash = ? WHERE id = ?",
+        "params": [password_hash, user_id]
+    }])
+
+FOOD_COLUMNS = "id, name, serving_desc, cal, protein, carbs, fat, provenance"
+
+def get_user_foods(user_id: int, search: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Get foods visible to a user: their own rows plus global catalog rows they don't override"""
+    pattern = f"%{search}%" if search else "%"
+    with get_user_connection(user_id) as conn:
+        cursor = conn.execute(
+            f"""SELECT {FOOD_COLUMNS}, 'user' AS scope FROM main.foods
+                WHERE user_id = ? AND name LIKE ?
+                UNION ALL
+                SELECT {FOOD_COLUMNS}, 'global' AS scope FROM {_catalog()}.foods g
+                WHERE g.user_id IS NULL AND g.name LIKE ?
+                  AND NOT EXISTS (SELECT 1 FROM main.foods u WHERE u.user_id = ? AND u.name = g.name)
+                ORDER BY name""",
+            (user_id, pattern, pattern, user_id)
+        )
         
         columns = [description[0] for description in cursor.description]
         return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
+FOOD_FIELDS = ("id", "name", "serving_desc", "cal", "protein", "carbs", "fat", "provenance", "scope")
+
+def get_user_foods_page(user_id: int, search: Optional[str] = None, after: Optional[str] = None,
+                        limit: int = 100, fields: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of get_user_foods in name order, starting after the name ``after``.
+
+    Names are unique across the two layers, so the last name is the cursor.
+    Each layer is read in index order and merged, so a page costs the same
+    at any catalog size; a search term only filters the rows scanned.
+    Returns (rows, name to continue after, or None on the last page).
+    """
+    fields = [f for f in FOOD_FIELDS if f in fields] if fields else list(FOOD_FIELDS)
+    columns = ["name"] + [f for f in fields if f not in ("name", "scope")]
+    select = ", ".join(columns)
+    where, params = "", []
+    if search:
+        where += " AND {t}name LIKE ?"
+        params.append(f"%{search}%")
+    if after is not None:
+        where += " AND {t}name > ?"
+        params.append(after)
+    with get_user_connection(user_id) as conn:
+        rows = conn.execute(
+            f"""SELECT {select}, 'user' AS scope FROM main.foods
+                WHERE user_id = ?{where.format(t="")}
+                UNION ALL
+                SELECT {select}, 'global' AS scope FROM {_catalog()}.foods g
+                WHERE g.user_id IS NULL{where.format(t="g.")}
+                  AND NOT EXISTS (SELECT 1 FROM main.foods u WHERE u.user_id = ? AND u.name = g.name)
+                ORDER BY name LIMIT ?""",
+            [user_id, *params, *params, user_id, limit + 1]
+        ).fetchall()
+    # scope is the extra last column
+    positions = [(f, len(columns) if f == "scope" else columns.index(f)) for f in fields]
+    next_after = rows[limit - 1][0] if len(rows) > limit else None
+    return [{f: row[i] for f, i in positions} for row in rows[:limit]], next_after
+
+def get_reference_foods() -> List[Dict[str, Any]]:
+    """Global catalog foods for the local estimator; rows it estimated itself are left out.
+
+    The index is shared by every user, so users' own foods are never indexed:
+    their names could otherwise surface in another user's estimates.
+    """
+    with get_connection() as conn:
+        rows = conn.execute(
+            """SELECT name, serving_desc, cal, protein, carbs, fat FROM foods
+               WHERE user_id IS NULL AND provenance IS NOT 'local_estimate'"""
+        ).fetchall()
+    return [dict(zip(("name", "serving_desc", "cal", "protein", "carbs", "fat"), r)) for r in rows]
+
+def lookup_food_id(user_id: int, name: str) -> Optional[int]:
+    """Resolve a food name for a user: their own food first, then the global catalog.
+
+    When sharded, a catalog food is pinned (copied) into the user's shard the
+    first time it is resolved there, so log items can reference it locally.
+    """
+    with get_user_connection(user_id) as conn:
+        row = conn.execute(
+            """SELECT id FROM main.foods WHERE user_id = ? AND name = ?
+               UNION ALL
+               SELECT id FROM main.foods WHERE user_id IS NULL AND name = ?
+               LIMIT 1""",
+            (user_id, name, name)
+        ).fetchone()
+        if row or not SHARDS:
+            return row[0] if row else None
+        food = conn.execute(
+            "SELECT name, serving_desc, cal, protein, carbs, fat, provenance FROM shared.foods "
+            "WHERE user_id IS NULL AND name = ?", (name,)
+        ).fetchone()
+    if not food:
+        return None
+    result = execute_write([{
+        "sql": """INSERT INTO foods (user_id, name, serving_desc, cal, protein, carbs, fat, provenance)
+                  VALUES (NULL, ?, ?, ?, ?, ?, ?, ?)
+                  ON CONFLICT(name) WHERE user_id IS NULL DO UPDATE SET name=excluded.name
+                  RETURNING id""",
+        "params": list(food)
+    }], fetch=True, user_id=user_id)
+    return result["rows"][0][0]
+
 def add_user_food(user_id: int, name: str, serving_desc: str, cal: float, 
                  protein: float, carbs: float, fat: float, provenance: str = "user") -> int:
-    """Add food for a specific user"""
-    with get_connection() as conn:
-        cursor = conn.execute(
-            """INSERT OR REPLACE INTO foods 
-               (user_id, name, serving_desc, cal, protein, carbs, fat, provenance)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            (user_id, name, serving_desc, cal, protein, carbs, fat, provenance)
-        )
-        return cursor.lastrowid
+    """Add or update a food for a specific user, keeping its id (and the logs that use it)"""
+    result = execute_write([{
+        "sql": """INSERT INTO foods (user_id, name, serving_desc, cal, protein, carbs, fat, provenance)
+                  VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                  ON CONFLICT(user_id, name) DO UPDATE SET
+                  serving_desc=excluded.serving_desc, cal=excluded.cal, protein=excluded.protein,
+                  carbs=excluded.carbs, fat=excluded.fat, provenance=excluded.provenance
+                  RETURNING id""",
+        "params": [user_id, name, serving_desc, cal, protein, carbs, fat, provenance]
+    }], fetch=True, user_id=user_id)
+    return result["rows"][0][0]
+
+def add_global_food(name: str, serving_desc: str, cal: float, protein: float,
+                    carbs: float, fat: float, provenance: str = "catalog") -> int:
+    """Add or update a food in the shared catalog, keeping its id stable"""
+    result = execute_write([{
+        "sql": """INSERT INTO foods (user_id, name, serving_desc, cal, protein, carbs, fat, provenance)
+                  VALUES (NULL, ?, ?, ?, ?, ?, ?, ?)
+                  ON CONFLICT(name) WHERE user_id IS NULL DO UPDATE SET
+                  serving_desc=excluded.serving_desc, cal=excluded.cal, protein=excluded.protein,
+                  carbs=excluded.carbs, fat=excluded.fat, provenance=excluded.provenance
+                  RETURNING id""",
+        "params": [name, serving_desc, cal, protein, carbs, fat, provenance]
+    }], fetch=True, catalog=True)
+    # summaries in shards are computed from the pinned copies
+    sync_pinned_foods([[name, serving_desc, cal, protein, carbs, fat, provenance]])
+    return result["rows"][0][0]
+
+_SYNC_PINNED_SQL = """UPDATE foods SET serving_desc = ?, cal = ?, protein = ?, carbs = ?, fat = ?, provenance = ?
+                      WHERE user_id IS NULL AND name = ?"""
+
+def sync_pinned_foods(rows: List[list]):
+    """Copy updated catalog foods, as [name, serving_desc, cal, protein, carbs, fat, provenance]
+    rows, to the copies lookup_food_id pinned into shards; names never pinned are skipped"""
+    if not SHARDS:
+        return
+    params = [[*row[1:], row[0]] for row in rows]
+    for shard in range(SHARDS):
+        if shard_path(shard).exists():
+            # user id k always routes to shard k
+            execute_write([{"sql": _SYNC_PINNED_SQL, "many": params}], user_id=shard, catalog=True)
 
 def get_user_goals(user_id: int) -> Optional[Dict[str, Any]]:
     """Get user's current goals"""
-    with get_connection() as conn:
+    with get_user_connection(user_id) as conn:
         cursor = conn.execute(
             "SELECT cal, protein, carbs, fat FROM goals WHERE user_id = ? AND goal_date IS NULL",
             (user_id,)
@@ -69,21 +471,41 @@ def get_user_goals(user_id: int) -> Optional[Dict[str, Any]]:
             }
         return None
 
-def set_user_goals(user_id: int, calories: float, protein_g: float, carbs_g: float, fat_g: float):
-    """Set user's goals"""
-    with get_connection() as conn:
-        conn.execute(
-            """INSERT INTO goals (user_id, goal_date, cal, protein, carbs, fat)
-               VALUES (?, NULL, ?, ?, ?, ?)
-               ON CONFLICT(user_id, goal_date) DO UPDATE SET
-               cal=excluded.cal, protein=excluded.protein,
-               carbs=excluded.carbs, fat=excluded.fat""",
-            (user_id, calories, protein_g, carbs_g, fat_g)
-        )
+def set_user_goals(user_id: int, calories: float, protein_g: float, carbs_g: float, fat_g: float,
+                   goal_date: Optional[str] = None):
+    """Set user's goals (the default goals when goal_date is None)"""
+    # UNIQUE(user_id, goal_date) never conflicts on NULL, so update first
+    execute_write([
+        {"sql": """UPDATE goals SET cal = ?, protein = ?, carbs = ?, fat = ?
+                   WHERE user_id = ? AND goal_date IS ?""",
+         "params": [calories, protein_g, carbs_g, fat_g, user_id, goal_date]},
+        {"sql": """INSERT INTO goals (user_id, goal_date, cal, protein, carbs, fat)
+                   SELECT ?, ?, ?, ?, ?, ? WHERE changes() = 0""",
+         "params": [user_id, goal_date, calories, protein_g, carbs_g, fat_g]},
+    ], user_id=user_id)
+
+def get_user_goal_history(user_id: int) -> List[tuple]:
+    """Get (goal_date, cal, protein, carbs, fat) rows, default goals (NULL date) first"""
+    with get_user_connection(user_id) as conn:
+        return conn.execute(
+            """SELECT goal_date, cal, protein, carbs, fat FROM goals
+               WHERE user_id = ? ORDER BY goal_date IS NOT NULL, goal_date""",
+            (user_id,)
+        ).fetchall()
+
+def insert_user_log_items(user_id: int, date: str, items: List[tuple]):
+    """Log (food_id, qty) pairs on a user's day in one transaction"""
+    execute_write([
+        {"sql": "INSERT OR IGNORE INTO logs (user_id, log_date) VALUES (?, ?)",
+         "params": [user_id, date]},
+        {"sql": """INSERT INTO log_items (log_id, food_id, qty)
+                   SELECT id, ?, ? FROM logs WHERE user_id = ? AND log_date = ?""",
+         "many": [[int(food_id), float(qty), user_id, date] for food_id, qty in items]},
+    ], user_id=user_id)
 
 def get_user_daily_summary(user_id: int, date: str) -> Dict[str, Any]:
     """Get daily nutrition summary for a user"""
-    with get_connection() as conn:
+    with get_user_connection(user_id) as conn:
         cursor = conn.execute("""
             SELECT COALESCE(SUM(f.cal*li.qty), 0),
                    COALESCE(SUM(f.protein*li.qty), 0),
@@ -103,3 +525,49 @@ def get_user_daily_summary(user_id: int, date: str) -> Dict[str, Any]:
             "carbs": row[2] or 0,
             "fat": row[3] or 0
         }
+
+def get_user_daily_totals(user_id: int, start: str, end: str) -> List[tuple]:
+    """Get (log_date, cal, protein, carbs, fat) per logged day in [start, end]"""
+    with get_user_connection(user_id) as conn:
+        return conn.execute("""
+            SELECT lg.log_date,
+                   SUM(f.cal*li.qty), SUM(f.protein*li.qty),
+                   SUM(f.carbs*li.qty), SUM(f.fat*li.qty)
+            FROM logs lg
+            JOIN log_items li ON li.log_id = lg.id
+            JOIN foods f ON f.id = li.food_id
+            WHERE lg.user_id = ? AND lg.log_date BETWEEN ? AND ?
+            GROUP BY lg.log_date
+            ORDER BY lg.log_date
+        """, (user_id, start, end)).fetchall()
+
+def iter_user_log_items(user_id: int, chunk_size: int = 1000) -> Iterator[tuple]:
+    """Stream (log_date, name, serving_desc, qty, cal, protein, carbs, fat, provenance)
+    for every logged item of a user, oldest first, without materializing the result.
+
+    The connection may be advanced from different threads (e.g. a streaming
+    response iterated in a threadpool) but only ever by one at a time.
+    """
+    path = shard_path(user_id)
+    if path == DB_PATH:
+        conn = get_connection(check_same_thread=False)
+    else:
+        conn = open_shard(path, check_same_thread=False)
+    try:
+        cursor = conn.execute("""
+            SELECT lg.log_date, f.name, f.serving_desc, li.qty,
+                   f.cal*li.qty, f.protein*li.qty, f.carbs*li.qty, f.fat*li.qty,
+                   f.provenance
+            FROM logs lg
+            JOIN log_items li ON li.log_id = lg.id
+            JOIN foods f ON f.id = li.food_id
+            WHERE lg.user_id = ?
+            ORDER BY lg.log_date, li.id
+        """, (user_id,))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
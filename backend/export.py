@@ -0,0 +1,57 @@
+"""
+Streaming export of a user's log history as NDJSON or CSV
+"""
+import csv
+import io
+import json
+from typing import Iterable, Iterator
+
+from database import iter_user_log_items
+
+EXPORT_COLUMNS = ("date", "food", "serving_desc", "qty", "cal", "protein", "carbs", "fat", "provenance")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Rows are buffered into chunks of roughly this many bytes before being sent
+CHUNK_BYTES = 64 * 1024
+
+
+def _ndjson_lines(rows: Iterable[tuple]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_COLUMNS, row)), separators=(",", ":")) + "\n"
+
+
+def _csv_lines(rows: Iterable[tuple]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()  # header only, for an empty history
+
+
+def _chunked(lines: Iterable[str]) -> Iterator[bytes]:
+    parts, size = [], 0
+    for line in lines:
+        parts.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield "".join(parts).encode("utf-8")
+            parts, size = [], 0
+    if parts:
+        yield "".join(parts).encode("utf-8")
+
+
+def export_user_logs(user_id: int, fmt: str = "ndjson") -> Iterator[bytes]:
+    """Encoded chunks of a user's full log history; memory use is independent of its size"""
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    rows = iter_user_log_items(user_id)
+    lines = _ndjson_lines(rows) if fmt == "ndjson" else _csv_lines(rows)
+    return _chunked(lines)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Bulk food catalog import from CSV or NDJSON
+
+Usage: python importer.py foods.csv [--user-id 1 | --global] [--format csv|ndjson]
+"""
+import argparse
+import csv
+import json
+import time
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+
+import sys
+sys.path.append('..')
+from app.validator import validate_food_args
+from database import execute_write, sync_pinned_foods
+
+# Rows per executemany/transaction
+CHUNK_SIZE = 10000
+
+# Reject samples kept for the report
+MAX_ERROR_SAMPLES = 20
+
+_UPDATE_SET = """DO UPDATE SET
+      serving_desc=excluded.serving_desc, cal=excluded.cal, protein=excluded.protein,
+      carbs=excluded.carbs, fat=excluded.fat, provenance=excluded.provenance"""
+
+USER_UPSERT_SQL = f"""
+    INSERT INTO foods (user_id, name, serving_desc, cal, protein, carbs, fat, provenance)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, name) {_UPDATE_SET}
+"""
+
+# Global catalog rows (user_id NULL) are unique through a partial index
+GLOBAL_UPSERT_SQL = f"""
+    INSERT INTO foods (user_id, name, serving_desc, cal, protein, carbs, fat, provenance)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(name) WHERE user_id IS NULL {_UPDATE_SET}
+"""
+
+
+def _iter_records(stream: IO[str], fmt: str) -> Iterator[Tuple[int, Any]]:
+    """Yield (line_number, record) pairs; undecodable NDJSON lines yield None"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "ndjson":
+        for line_num, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_num, json.loads(line)
+            except json.JSONDecodeError:
+                yield line_num, None
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def import_foods(stream: IO[str], fmt: str, user_id: Optional[int],
+                 provenance: str = "import", chunk_size: int = CHUNK_SIZE) -> Dict[str, Any]:
+    """Validate and upsert foods from a text stream in chunked transactions.
+
+    A user_id of None imports into the shared global catalog. Rows are
+    checked with the same rules as the add_food action; rejected rows are
+    counted and sampled, never inserted.
+    """
+    read = imported = rejected = 0
+    errors: List[Dict[str, Any]] = []
+    batch: List[list] = []
+    started = time.perf_counter()
+    upsert_sql = GLOBAL_UPSERT_SQL if user_id is None else USER_UPSERT_SQL
+
+    def flush():
+        nonlocal imported
+        # a user's rows go to their shard; None (the global catalog) to the main database
+        execute_write([{"sql": upsert_sql, "many": batch}], user_id=user_id, catalog=user_id is None)
+        if user_id is None:
+            sync_pinned_foods([row[1:] for row in batch])
+        imported += len(batch)
+        batch.clear()
+
+    for line_num, record in _iter_records(stream, fmt):
+        read += 1
+        problems = ["row is not a JSON object"] if not isinstance(record, dict) else validate_food_args(record)
+        if not problems and not record["name"].strip():
+            problems = ["name missing or invalid"]
+        if problems:
+            rejected += 1
+            if len(errors) < MAX_ERROR_SAMPLES:
+                errors.append({"line": line_num, "errors": problems})
+            continue
+        batch.append([
+            user_id, record["name"].strip(), record["serving_desc"],
+            float(record["cal"]), float(record["protein"]),
+            float(record["carbs"]), float(record["fat"]),
+            record.get("provenance") or provenance,
+        ])
+        if len(batch) >= chunk_size:
+            flush()
+    if batch:
+        flush()
+
+    seconds = time.perf_counter() - started
+    return {
+        "rows_read": read,
+        "imported": imported,
+        "rejected": rejected,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(read / seconds) if seconds else read,
+        "errors": errors,
+    }
+
+
+def format_for(filename: str, fmt: Optional[str] = None) -> str:
+    """Explicit format, else inferred from the file extension"""
+    if fmt:
+        return fmt
+    return "ndjson" if filename.endswith((".ndjson", ".jsonl")) else "csv"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import foods from CSV or NDJSON")
+    parser.add_argument("path")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--user-id", type=int, default=1)
+    target.add_argument("--global", dest="global_catalog", action="store_true",
+                        help="import into the shared catalog instead of one user's foods")
+    parser.add_argument("--format", choices=["csv", "ndjson"])
+    args = parser.parse_args()
+
+    with open(args.path, encoding="utf-8", newline="") as f:
+        user_id = None if args.global_catalog else args.user_id
+        report = import_foods(f, format_for(args.path, args.format), user_id)
+    print(f"Imported {report['imported']} of {report['rows_read']} rows "
+          f"({report['rejected']} rejected) in {report['seconds']}s, {report['rows_per_sec']} rows/s")
+    for err in report["errors"]:
+        print(f"  line {err['line']}: {'; '.join(err['errors'])}")
@@ -0,0 +1,226 @@
+"""
+Background nutrition estimates for foods logged before anyone knew them
+
+Meal logging stores an unknown food right away as a provisional catalog
+row (provenance 'pending_estimate', zero macros) and queues a row in
+estimate_jobs. Worker threads claim jobs through execute_write, so a claim
+is exclusive even across API worker processes, and retry failures with
+exponential backoff. A job whose worker died mid-run is claimed again once
+its lease runs out.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import sys
+sys.path.append('..')
+from app.llm import estimate_food
+from app.main import parse_turn
+from app.validator import validate_food_args
+import database
+from database import execute_write, get_connection
+
+MAX_ATTEMPTS = int(os.getenv("ESTIMATE_MAX_ATTEMPTS", "5"))
+WORKERS = int(os.getenv("ESTIMATE_WORKERS", "1"))
+LEASE_SECONDS = 300
+BACKOFF_SECONDS = 2.0
+POLL_SECONDS = 2.0
+
+JOB_COLUMNS = ("id", "food_id", "name", "status", "attempts", "last_error", "created_at", "updated_at")
+
+_CLAIM_SQL = """
+    UPDATE estimate_jobs
+    SET status = 'running', attempts = attempts + 1, lease_until = :lease_until,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = (
+      SELECT id FROM estimate_jobs
+      WHERE (status = 'queued' AND run_after <= :now)
+         OR (status = 'running' AND lease_until < :now)
+      ORDER BY id LIMIT 1)
+    RETURNING id, food_id, name, attempts
+"""
+
+_FILL_FOOD_SQL = """
+    UPDATE foods SET serving_desc = :serving_desc, cal = :cal, protein = :protein,
+      carbs = :carbs, fat = :fat, provenance = :provenance
+    WHERE user_id IS NULL AND name = :name AND provenance = 'pending_estimate'
+"""
+
+
+def enqueue_estimate(user_id: int, name: str) -> int:
+    """Create the provisional catalog food for ``name`` and queue its estimate; returns the job id"""
+    result = execute_write([
+        {"sql": """INSERT INTO foods (user_id, name, serving_desc, cal, protein, carbs, fat, provenance)
+                   VALUES (NULL, ?, '1 serving', 0, 0, 0, 0, 'pending_estimate')
+                   ON CONFLICT(name) WHERE user_id IS NULL DO NOTHING""",
+         "params": [name]},
+        {"sql": """INSERT INTO estimate_jobs (food_id, name, requested_by)
+                   SELECT id, name, ? FROM foods WHERE user_id IS NULL AND name = ?
+                   ON CONFLICT(food_id) DO UPDATE SET name = excluded.name
+                   RETURNING id""",
+         "params": [user_id, name]},
+    ], fetch=True, catalog=True)
+    estimate_workers.wake()
+    return result["rows"][0][0]
+
+
+def claim_job() -> Optional[Dict[str, Any]]:
+    now = time.time()
+    result = execute_write([{"sql": _CLAIM_SQL, "params": {"now": now, "lease_until": now + LEASE_SECONDS}}],
+                           fetch=True)
+    if not result["rows"]:
+        return None
+    return dict(zip(("id", "food_id", "name", "attempts"), result["rows"][0]))
+
+
+def _estimate(name: str) -> Dict[str, Any]:
+    # the local tier already declined this name when the job was queued, and a job
+    # should back off and retry rather than store a placeholder while the LLM is down
+    parsed = parse_turn(estimate_food(name, use_local=False, degrade=False))
+    for a in parsed["actions"]:
+        if a.get("action") == "add_food":
+            problems = validate_food_args(a["args"])
+            if problems:
+                raise ValueError("; ".join(problems))
+            return a["args"]
+    raise ValueError(parsed.get("speak") or "estimate returned no add_food action")
+
+
+def complete_job(job: Dict[str, Any], args: Dict[str, Any]):
+    """Fill in the provisional food everywhere it lives, then mark the job done"""
+    fill = {"name": job["name"], "serving_desc": args["serving_desc"],
+            "cal": float(args["cal"]), "protein": float(args["protein"]),
+            "carbs": float(args["carbs"]), "fat": float(args["fat"]),
+            "provenance": args.get("provenance") or "llm_estimate"}
+    # Pinned shard copies first: if we die before the main commit, the job is retried
+    for shard in range(database.SHARDS):
+        if database.shard_path(shard).exists():
+            # user id k always routes to shard k
+            execute_write([{"sql": _FILL_FOOD_SQL, "params": fill}], user_id=shard, catalog=True)
+    execute_write([
+        {"sql": _FILL_FOOD_SQL, "params": fill},
+        {"sql": """UPDATE estimate_jobs SET status = 'done', last_error = NULL, lease_until = NULL,
+                   updated_at = CURRENT_TIMESTAMP WHERE id = ?""",
+         "params": [job["id"]]},
+    ], catalog=True)
+
+
+def fail_job(job: Dict[str, Any], error: str):
+    """Retry later with exponential backoff, or give up after MAX_ATTEMPTS"""
+    if job["attempts"] >= MAX_ATTEMPTS:
+        sql, params = ("""UPDATE estimate_jobs SET status = 'failed', last_error = ?, lease_until = NULL,
+                          updated_at = CURRENT_TIMESTAMP WHERE id = ?""", [error, job["id"]])
+    else:
+        retry_at = time.time() + BACKOFF_SECONDS * 2 ** (job["attempts"] - 1)
+        sql, params = ("""UPDATE estimate_jobs SET status = 'queued', last_error = ?, run_after = ?,
+                          lease_until = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = ?""",
+                       [error, retry_at, job["id"]])
+    execute_write([{"sql": sql, "params": params}])
+
+
+def retry_job(job_id: int, user_id: int) -> bool:
+    """Queue a failed job that ``user_id``'s meal queued again, with a fresh set of attempts"""
+    result = execute_write([{
+        "sql": """UPDATE estimate_jobs SET status = 'queued', attempts = 0, run_after = 0,
+                  updated_at = CURRENT_TIMESTAMP
+                  WHERE id = ? AND requested_by = ? AND status = 'failed'""",
+        "params": [job_id, user_id]
+    }])
+    if result["rowcount"]:
+        estimate_workers.wake()
+    return bool(result["rowcount"])
+
+
+def run_job(job: Dict[str, Any]) -> bool:
+    try:
+        complete_job(job, _estimate(job["name"]))
+        return True
+    except Exception as e:
+        fail_job(job, f"{type(e).__name__}: {e}")
+        return False
+
+
+class EstimateWorkers:
+    """Worker threads draining estimate_jobs; ``on_done`` runs after each finished job"""
+
+    def __init__(self, count: int = WORKERS, on_done: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.count = count
+        self.on_done = on_done
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.completed = 0
+        self.failures = 0
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping.clear()
+        for i in range(self.count):
+            t = threading.Thread(target=self._loop, name=f"estimate-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+
+    def wake(self):
+        self._wakeup.set()
+
+    def run_pending(self) -> int:
+        """Run every job that is due right now in the calling thread; returns how many ran"""
+        ran = 0
+        while not self._stopping.is_set():
+            job = claim_job()
+            if job is None:
+                return ran
+            if run_job(job):
+                self.completed += 1
+                if self.on_done:
+                    self.on_done(job)
+            else:
+                self.failures += 1
+            ran += 1
+        return ran
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            try:
+                ran = self.run_pending()
+            except Exception as e:
+                print(f"[estimate-worker] {type(e).__name__}: {e}")
+                ran = 0
+            if not ran:
+                self._wakeup.wait(POLL_SECONDS)
+
+
+estimate_workers = EstimateWorkers()
+
+
+def get_estimate_job(job_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+    """One job, or None when it doesn't exist or another user's meal queued it"""
+    with get_connection() as conn:
+        row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM estimate_jobs WHERE id = ? AND requested_by = ?",
+                           (job_id, user_id)).fetchone()
+    return dict(zip(JOB_COLUMNS, row)) if row else None
+
+
+def get_user_estimate_jobs(user_id: int, limit: int = 50) -> Dict[str, Any]:
+    """Status counts and the most recent jobs a user's meals queued"""
+    with get_connection() as conn:
+        counts = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM estimate_jobs WHERE requested_by = ? GROUP BY status",
+            (user_id,)).fetchall())
+        rows = conn.execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM estimate_jobs WHERE requested_by = ? "
+            "ORDER BY id DESC LIMIT ?", (user_id, limit)).fetchall()
+    return {
+        "counts": {s: counts.get(s, 0) for s in ("queued", "running", "done", "failed")},
+        "jobs": [dict(zip(JOB_COLUMNS, r)) for r in rows],
+    }
@@ -0,0 +1,187 @@
+"""
+Per-user live dashboard updates over WebSocket
+
+Write paths call ``publish_*`` after they commit, and every open connection
+of that user is sent the new daily totals or goals. A connection buffers at
+most one pending message per key (one per summary date, one for goals), so
+a slow client holds the latest state instead of a backlog. Messages equal
+to what the client last received are never sent.
+"""
+import asyncio
+from collections import OrderedDict, defaultdict
+from datetime import date as dt
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+# Distinct keys a connection may have pending (and remembers as sent)
+MAX_PENDING = 16
+
+# How often to check for commits by other worker processes (multi-worker mode only)
+POLL_SECONDS = 1.0
+
+
+class _Subscription:
+    """One open connection: pending messages coalesced by key, plus what it already has"""
+
+    def __init__(self):
+        self.pending: "OrderedDict[Hashable, dict]" = OrderedDict()
+        self.sent: "OrderedDict[Hashable, dict]" = OrderedDict()
+        self.wakeup = asyncio.Event()
+
+    def offer(self, key: Hashable, message: dict) -> Tuple[bool, bool]:
+        """Queue a message; returns (replaced_pending, dropped_oldest)"""
+        if key not in self.pending and self.sent.get(key) == message:
+            return False, False
+        replaced = key in self.pending
+        self.pending[key] = message
+        self.pending.move_to_end(key)
+        dropped = len(self.pending) > MAX_PENDING
+        if dropped:
+            self.pending.popitem(last=False)
+        self.wakeup.set()
+        return replaced, dropped
+
+    def mark_sent(self, key: Hashable, message: dict):
+        self.sent[key] = message
+        self.sent.move_to_end(key)
+        while len(self.sent) > MAX_PENDING:
+            self.sent.popitem(last=False)
+
+
+class LiveHub:
+    """Tracks each user's connections and fans committed changes out to them.
+
+    ``summary_fn(user_id, date)`` and ``goals_fn(user_id)`` build the pushed
+    payloads. Publishing is safe from any thread. When other processes write
+    too, set ``version_fn`` (like the response cache) and changes are picked
+    up by polling.
+    """
+
+    def __init__(self):
+        self.summary_fn: Optional[Callable[[int, str], Dict[str, Any]]] = None
+        self.goals_fn: Optional[Callable[[int], Dict[str, Any]]] = None
+        self.version_fn: Optional[Callable[[int], Hashable]] = None
+        self._subs: Dict[int, Set[_Subscription]] = defaultdict(set)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._watcher: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def has_subscribers(self, user_id: int) -> bool:
+        return bool(self._subs.get(user_id))
+
+    def _deliver(self, user_id: int, items: List[Tuple[Hashable, dict]]):
+        # event loop thread only
+        for sub in self._subs.get(user_id, ()):
+            for key, message in items:
+                replaced, dropped = sub.offer(key, message)
+                self.coalesced += replaced
+                self.dropped += dropped
+
+    def _publish(self, user_id: int, items: List[Tuple[Hashable, dict]]):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._deliver(user_id, items)
+        else:
+            loop.call_soon_threadsafe(self._deliver, user_id, items)
+
+    def _summary_item(self, user_id: int, date: str) -> Tuple[Hashable, dict]:
+        return ("summary", date), {"type": "summary", "date": date, "summary": self.summary_fn(user_id, date)}
+
+    def _goals_item(self, user_id: int) -> Tuple[Hashable, dict]:
+        return "goals", {"type": "goals", "goals": self.goals_fn(user_id)}
+
+    def publish_summary(self, user_id: int, date: str):
+        """Push a day's totals after a write to that day's log"""
+        if self.has_subscribers(user_id):
+            self._publish(user_id, [self._summary_item(user_id, date)])
+
+    def publish_goals(self, user_id: int):
+        if self.has_subscribers(user_id):
+            self._publish(user_id, [self._goals_item(user_id)])
+
+    def publish_day(self, user_id: int, date: Optional[str] = None):
+        """Push a day's totals and the goals when a write could have touched either (e.g. chat SQL)"""
+        if self.has_subscribers(user_id):
+            self._publish(user_id, [self._summary_item(user_id, date or dt.today().isoformat()),
+                                    self._goals_item(user_id)])
+
+    def publish_everyone(self):
+        """Push today's totals to every connected user, e.g. after a shared catalog food changed"""
+        for user_id in list(self._subs):
+            self.publish_day(user_id)
+
+    async def _watch_versions(self):
+        versions: Dict[int, Hashable] = {}
+        while True:
+            await asyncio.sleep(POLL_SECONDS)
+            for user_id in list(self._subs):
+                try:
+                    version = self.version_fn(user_id)
+                except Exception as e:
+                    print(f"[live] version check failed: {e}")
+                    continue
+                if versions.get(user_id, version) != version:
+                    self.publish_day(user_id)
+                versions[user_id] = version
+            for user_id in [u for u in versions if u not in self._subs]:
+                del versions[user_id]
+
+    async def serve(self, websocket: WebSocket, user_id: int, date: str):
+        """Stream updates to an accepted, authenticated connection until it closes"""
+        self._loop = asyncio.get_running_loop()
+        if self.version_fn and self._watcher is None:
+            self._watcher = self._loop.create_task(self._watch_versions())
+        sub = _Subscription()
+        self._subs[user_id].add(sub)
+        # The first messages are the current state, so the dashboard needs no REST calls
+        for key, message in (self._summary_item(user_id, date), self._goals_item(user_id)):
+            sub.offer(key, message)
+        closed = asyncio.ensure_future(self._until_closed(websocket))
+        try:
+            while not closed.done():
+                woken = asyncio.ensure_future(sub.wakeup.wait())
+                await asyncio.wait({closed, woken}, return_when=asyncio.FIRST_COMPLETED)
+                woken.cancel()
+                sub.wakeup.clear()
+                while sub.pending and not closed.done():
+                    key, message = sub.pending.popitem(last=False)
+                    await websocket.send_json(message)
+                    sub.mark_sent(key, message)
+                    self.sent += 1
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            closed.cancel()
+            self._subs[user_id].discard(sub)
+            if not self._subs[user_id]:
+                del self._subs[user_id]
+
+    @staticmethod
+    async def _until_closed(websocket: WebSocket):
+        # Clients send nothing after authenticating; reading just notices the close
+        try:
+            while True:
+                await websocket.receive_text()
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._subs),
+            "connections": sum(len(s) for s in self._subs.values()),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
+
+
+live_hub = LiveHub()
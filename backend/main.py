@@ -2,24 +2,61 @@
 """
 FastAPI main application for AI-Powered Nutrition Coach
 """
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, UploadFile, File, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import uvicorn
+import asyncio
+import base64
+import binascii
+import csv
+import io
+import json
 import os
 from dotenv import load_dotenv
 
 # Import existing modules
 import sys
 sys.path.append('..')
-from app.llm import chat_once, estimate_food
+from app.llm import chat_once, estimate_food, llm_stats
+from app.estimator import local_estimator
 from db import api
 from database import (
-    init_database, get_user_foods, add_user_food, 
-    get_user_goals, set_user_goals, get_user_daily_summary, get_connection
+    init_database, get_user_foods_page, FOOD_FIELDS, add_user_food, 
+    get_user_goals, set_user_goals, get_user_daily_summary,
+    data_version, get_reference_foods
 )
+from cache import response_cache, etag_matches
+from analytics import compute_analytics
+from export import export_user_logs, MEDIA_TYPES as EXPORT_MEDIA_TYPES
+from importer import import_foods, format_for
+from meals import log_user_meal
+from jobs import estimate_workers, get_estimate_job, get_user_estimate_jobs, retry_job
+from auth import authenticate, get_current_user, login_user, register_user
+from live import live_hub
+from suggest import food_matrices, suggest_meals, wants_suggestion, describe as describe_suggestions
+
+local_estimator.loader = get_reference_foods
+
+live_hub.summary_fn = get_user_daily_summary
+live_hub.goals_fn = lambda user_id: _goals_or_default(user_id)
+
+def _estimate_done(job):
+    # A finished estimate changes a shared catalog food, and with it every summary that logged it
+    response_cache.invalidate_all("foods", "summary")
+    food_matrices.invalidate_all()
+    live_hub.publish_everyone()
+
+estimate_workers.on_done = _estimate_done
+
+# Other workers and the CLI tools (importer, seed_data, compaction) commit through
+# execute_write too; their change counters must invalidate our caches as well
+response_cache.version_fn = data_version
+live_hub.version_fn = data_version
+food_matrices.version_fn = data_version
 
 load_dotenv()
 
@@ -37,11 +74,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
-# Security
-security = HTTPBearer()
-
 # Pydantic models
 class UserLogin(BaseModel):
     email: str
@@ -73,6 +108,7 @@ class SetGoalRequest(BaseModel):
     protein_g: float
     carbs_g: float
     fat_g: float
+    date: Optional[str] = None  # YYYY-MM-DD for a single day, None for the default
 
 class ChatMessage(BaseModel):
     message: str
@@ -82,15 +118,26 @@ class ChatResponse(BaseModel):
     speak: str
     actions: List[Dict[str, Any]]
     sql_commands: List[Dict[str, Any]] = []
+    suggestions: List[Dict[str, Any]] = []
 
-# Security scheme
-security = HTTPBearer()
+def _cached_json(request: Request, user_id: int, resource: str, params, compute) -> Response:
+    """Serve a cached JSON body with a strong ETag, answering 304 when the client copy is current"""
+    entry = response_cache.get_or_compute(user_id, resource, params, compute)
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        response_cache.record_not_modified()
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
 
-# Authentication dependency (simplified for now)
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    # For now, just return a mock user_id
-    # In production, validate JWT token
-    return {"user_id": 1, "email": "demo@example.com"}
+@app.on_event("startup")
+def start_estimate_workers():
+    estimate_workers.start()
+    # build the food index in the background before the first lookup needs it
+    local_estimator.refresh()
+
+@app.on_event("shutdown")
+def stop_estimate_workers():
+    estimate_workers.stop()
 
 # Health check endpoint
 @app.get("/")
@@ -104,23 +151,50 @@ async def health_check():
 # Authentication endpoints
 @app.post("/api/auth/login")
 async def login(user: UserLogin):
-    # Simplified authentication for demo
-    if user.email == "demo@example.com" and user.password == "demo123":
-        return {"token": "demo_token_123", "user": {"id": 1, "email": user.email}}
-    raise HTTPException(status_code=401, detail="Invalid credentials")
+    return await login_user(user.email, user.password)
 
 @app.post("/api/auth/register")
 async def register(user: UserRegister):
-    # Simplified registration for demo
-    return {"token": "demo_token_123", "user": {"id": 1, "email": user.email}}
+    return await register_user(user.email, user.password)
 
 # Food management endpoints
+# Page size bounds for /api/foods
+DEFAULT_FOODS_LIMIT = 100
+MAX_FOODS_LIMIT = 500
+
+def _encode_cursor(name: str) -> str:
+    return base64.urlsafe_b64encode(name.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @app.get("/api/foods")
-async def get_foods(search: Optional[str] = None, current_user: dict = Depends(get_current_user)):
-    """Get list of foods, optionally filtered by search term"""
+async def get_foods(request: Request, search: Optional[str] = None, cursor: Optional[str] = None,
+                    limit: int = DEFAULT_FOODS_LIMIT, fields: Optional[str] = None,
+                    current_user: dict = Depends(get_current_user)):
+    """List foods in name order, one page at a time.
+
+    Pass the returned ``next_cursor`` to get the following page; ``fields`` is
+    a comma-separated subset of the food columns (e.g. ``id,name,cal``).
+    """
+    if not 1 <= limit <= MAX_FOODS_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_FOODS_LIMIT}")
+    selected = tuple(f.strip() for f in fields.split(",") if f.strip()) if fields else FOOD_FIELDS
+    unknown = [f for f in selected if f not in FOOD_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    after = _decode_cursor(cursor) if cursor else None
+    user_id = current_user["user_id"]
+
+    def page():
+        rows, next_after = get_user_foods_page(user_id, search, after, limit, list(selected))
+        return {"items": rows, "next_cursor": _encode_cursor(next_after) if next_after is not None else None}
+
     try:
-        foods = get_user_foods(current_user["user_id"], search)
-        return foods
+        return _cached_json(request, user_id, "foods", (search, after, limit, selected), page)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -128,7 +202,8 @@ async def get_foods(search: Optional[str] = None, current_user: dict = Depends(g
 async def add_food(food: FoodItem, current_user: dict = Depends(get_current_user)):
     """Add a new food item to the database"""
     try:
-        food_id = add_user_food(
+        food_id = await run_in_threadpool(
+            add_user_food,
             current_user["user_id"],
             food.name, 
             food.serving_desc, 
@@ -138,36 +213,61 @@ async def add_food(food: FoodItem, current_user: dict = Depends(get_current_user
             food.fat, 
             food.provenance
         )
+        response_cache.invalidate(current_user["user_id"], "foods")
+        food_matrices.invalidate(current_user["user_id"])
         return {"success": True, "message": "Food added successfully", "food_id": food_id}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/api/foods/import")
+async def import_food_catalog(file: UploadFile = File(...), format: Optional[str] = None,
+                              current_user: dict = Depends(get_current_user)):
+    """Bulk upsert foods from an uploaded CSV or NDJSON file"""
+    fmt = format_for(file.filename or "", format)
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    try:
+        stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+        report = await run_in_threadpool(import_foods, stream, fmt, current_user["user_id"])
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        response_cache.invalidate(current_user["user_id"], "foods")
+        food_matrices.invalidate(current_user["user_id"])
+        local_estimator.invalidate()
+    return report
+
 # Meal logging endpoints
 @app.post("/api/meals")
 async def log_meal(meal: LogMealRequest, current_user: dict = Depends(get_current_user)):
     """Log a meal with multiple food items"""
     try:
-        # Convert to the format expected by existing function
         items = [{"name": item.name, "qty": item.qty} for item in meal.items]
+        # estimating unknown foods and the write itself block; keep them off the event loop
+        result = await run_in_threadpool(log_user_meal, current_user["user_id"], items, meal.date)
+        response_cache.invalidate(current_user["user_id"], "summary")
+        live_hub.publish_summary(current_user["user_id"], result["date"])
+        if result["estimated"]:
+            # Estimates go to the shared catalog, visible to every user
+            response_cache.invalidate_all("foods")
+            food_matrices.invalidate_all()
         
-        # Use existing log_meal logic
-        from app.main import _log_meal_with_estimates
-        _log_meal_with_estimates({"items": items, "date": meal.date})
-        
-        return {"success": True, "message": "Meal logged successfully"}
+        return {"success": True, "message": "Meal logged successfully",
+                "estimated": result["estimated"], "pending": result["pending"]}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # Nutrition summary endpoint
 @app.get("/api/summary")
-async def get_daily_summary(date: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+async def get_daily_summary(request: Request, date: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     """Get daily nutrition summary"""
     try:
         from datetime import date as dt
         if not date:
             date = dt.today().isoformat()
-        summary = get_user_daily_summary(current_user["user_id"], date)
-        return summary
+        user_id = current_user["user_id"]
+        return _cached_json(request, user_id, "summary", date,
+                            lambda: get_user_daily_summary(user_id, date))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -176,29 +276,103 @@ async def get_daily_summary(date: Optional[str] = None, current_user: dict = Dep
 async def set_goal(goal: SetGoalRequest, current_user: dict = Depends(get_current_user)):
     """Set nutrition goals"""
     try:
-        set_user_goals(current_user["user_id"], goal.calories, goal.protein_g, goal.carbs_g, goal.fat_g)
+        await run_in_threadpool(set_user_goals, current_user["user_id"], goal.calories, goal.protein_g,
+                                goal.carbs_g, goal.fat_g, goal.date)
+        response_cache.invalidate(current_user["user_id"], "goals")
+        live_hub.publish_goals(current_user["user_id"])
         return {"success": True, "message": "Goals set successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/goals")
-async def get_goals(current_user: dict = Depends(get_current_user)):
+async def get_goals(request: Request, current_user: dict = Depends(get_current_user)):
     """Get current nutrition goals"""
     try:
-        goals = get_user_goals(current_user["user_id"])
-        if goals:
-            return goals
-        else:
-            # Return default goals if none set
-            return {
-                "calories": 2000,
-                "protein_g": 150,
-                "carbs_g": 200,
-                "fat_g": 80
-            }
+        user_id = current_user["user_id"]
+        return _cached_json(request, user_id, "goals", None,
+                            lambda: _goals_or_default(user_id))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Returned when a user has not set goals yet
+DEFAULT_GOALS = {
+    "calories": 2000,
+    "protein_g": 150,
+    "carbs_g": 200,
+    "fat_g": 80
+}
+
+def _goals_or_default(user_id: int) -> Dict[str, Any]:
+    return get_user_goals(user_id) or DEFAULT_GOALS
+
+# Analytics endpoint
+@app.get("/api/analytics")
+async def get_analytics(start: Optional[str] = None, end: Optional[str] = None, window: int = 7,
+                        current_user: dict = Depends(get_current_user)):
+    """Weekly/monthly rollups, rolling averages, goal adherence and streaks"""
+    try:
+        if not 1 <= window <= 90:
+            raise ValueError("window must be between 1 and 90 days")
+        return await run_in_threadpool(compute_analytics, current_user["user_id"], DEFAULT_GOALS,
+                                       start, end, window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Meal suggestions
+@app.get("/api/suggestions")
+async def get_suggestions(date: Optional[str] = None, limit: int = 3, current_user: dict = Depends(get_current_user)):
+    """Foods and servings that close the gap between the day's totals and the goals"""
+    if not 1 <= limit <= 10:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 10")
+    user_id = current_user["user_id"]
+    return await run_in_threadpool(suggest_meals, user_id, _goals_or_default(user_id), date, limit)
+
+# Export endpoint
+@app.get("/api/export")
+async def export_logs(format: str = "ndjson", current_user: dict = Depends(get_current_user)):
+    """Stream the user's full log history as NDJSON or CSV"""
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(EXPORT_MEDIA_TYPES)}")
+    return StreamingResponse(
+        export_user_logs(current_user["user_id"], format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="tracker-export.{format}"'}
+    )
+
+def _apply_chat_actions(user_id: int, actions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Run chat add_food/log_meal/set_goal actions through the same paths as the REST endpoints"""
+    results = []
+    for a in actions:
+        name, args = a.get("action"), a.get("args", {})
+        try:
+            if name == "add_food":
+                description = f"Add food: {args['name']}"
+                add_user_food(user_id, args["name"], args["serving_desc"], float(args["cal"]),
+                              float(args["protein"]), float(args["carbs"]), float(args["fat"]), "llm_estimate")
+                response_cache.invalidate(user_id, "foods")
+                food_matrices.invalidate(user_id)
+            elif name == "log_meal":
+                items = args.get("items", [])
+                description = "Log " + ", ".join(f"{it.get('qty', 1)} {it.get('name')}" for it in items)
+                result = log_user_meal(user_id, items, args.get("date"))
+                response_cache.invalidate(user_id, "summary")
+                live_hub.publish_summary(user_id, result["date"])
+                if result["estimated"]:
+                    response_cache.invalidate_all("foods")
+                    food_matrices.invalidate_all()
+            elif name == "set_goal":
+                description = "Set nutrition goals"
+                set_user_goals(user_id, float(args["calories"]), float(args["protein_g"]),
+                               float(args["carbs_g"]), float(args["fat_g"]))
+                response_cache.invalidate(user_id, "goals")
+                live_hub.publish_goals(user_id)
+            else:
+                continue
+            results.append({"success": True, "description": description})
+        except Exception as e:
+            results.append({"success": False, "error": str(e), "description": f"{name} failed"})
+    return results
+
 # LLM Chat endpoint
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat_with_llm(chat: ChatMessage, current_user: dict = Depends(get_current_user)):
@@ -207,47 +381,113 @@ async def chat_with_llm(chat: ChatMessage, current_user: dict = Depends(get_curr
         # Add user message to history
         history = chat.history + [{"role": "user", "content": chat.message}]
         
-        # Get LLM response
-        raw_response = chat_once(history)
+        # Get LLM response; "what should I eat?" is answered locally
+        if wants_suggestion(chat.message):
+            raw_response = json.dumps({"speak": "", "done": False,
+                                       "actions": [{"action": "suggest_meal", "args": {}}]})
+        else:
+            raw_response = await run_in_threadpool(chat_once, history)
         
         # Parse the response using existing logic
-        import sys
-        sys.path.append('..')
-        from app.main import parse_turn, generate_sql_commands
+        from app.main import parse_turn
         parsed = parse_turn(raw_response)
         
-        # Generate and execute SQL commands based on validated actions
-        sql_commands = generate_sql_commands(parsed["actions"])
-        sql_results = []
-        for sql_cmd in sql_commands:
-            try:
-                with get_connection() as conn:
-                    conn.execute(sql_cmd["sql"])
-                    conn.commit()
-                sql_results.append({"success": True, "description": sql_cmd.get("description", "")})
-            except Exception as e:
-                sql_results.append({"success": False, "error": str(e), "description": sql_cmd.get("description", "")})
+        # Apply validated actions to the caller's own data
+        sql_results = await run_in_threadpool(_apply_chat_actions, current_user["user_id"], parsed["actions"])
+        
+        speak, suggestions = parsed["speak"], []
+        for a in parsed["actions"]:
+            if a.get("action") == "suggest_meal":
+                result = await run_in_threadpool(suggest_meals, current_user["user_id"],
+                                                 _goals_or_default(current_user["user_id"]), a["args"].get("date"))
+                speak, suggestions = describe_suggestions(result), result["suggestions"]
         
         return ChatResponse(
-            speak=parsed["speak"],
+            speak=speak,
             actions=parsed["actions"],
-            sql_commands=sql_results
+            sql_commands=sql_results,
+            suggestions=suggestions
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM error: {str(e)}")
 
+# Live dashboard updates
+@app.websocket("/api/live")
+async def live_updates(websocket: WebSocket, date: Optional[str] = None):
+    """Push daily totals and goals whenever they change.
+
+    The client's first message must be {"token": "<bearer token>"}; browsers
+    can't set headers on WebSocket requests, and query strings end up in logs.
+    """
+    await websocket.accept()
+    try:
+        first = await asyncio.wait_for(websocket.receive_json(), timeout=10)
+        user = authenticate(str(first.get("token", "")))
+    except WebSocketDisconnect:
+        return
+    except (HTTPException, asyncio.TimeoutError, ValueError, AttributeError):
+        await websocket.close(code=4401)
+        return
+    from datetime import date as dt
+    await live_hub.serve(websocket, user["user_id"], date or dt.today().isoformat())
+
 # Food estimation endpoint
 @app.post("/api/foods/estimate")
 async def estimate_food_nutrition(name: str, current_user: dict = Depends(get_current_user)):
     """Get nutrition estimation for a food item using LLM"""
     try:
-        raw_response = estimate_food(name)
+        raw_response = await run_in_threadpool(estimate_food, name)
         from app.main import parse_turn
         parsed = parse_turn(raw_response)
         return parsed
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Estimation error: {str(e)}")
 
+# Background estimate jobs
+@app.get("/api/jobs/estimates")
+async def list_estimate_jobs(current_user: dict = Depends(get_current_user)):
+    """Status counts and recent estimate jobs queued by this user's meals"""
+    return get_user_estimate_jobs(current_user["user_id"])
+
+@app.get("/api/jobs/estimates/{job_id}")
+async def estimate_job_status(job_id: int, current_user: dict = Depends(get_current_user)):
+    """Progress of one estimate job"""
+    job = get_estimate_job(job_id, current_user["user_id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/api/jobs/estimates/{job_id}/retry")
+async def retry_estimate_job(job_id: int, current_user: dict = Depends(get_current_user)):
+    """Queue a failed estimate job again"""
+    user_id = current_user["user_id"]
+    if get_estimate_job(job_id, user_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not await run_in_threadpool(retry_job, job_id, user_id):
+        raise HTTPException(status_code=409, detail="Only failed jobs can be retried")
+    return get_estimate_job(job_id, user_id)
+
+# Cache metrics
+@app.get("/api/metrics/cache")
+async def cache_metrics(current_user: dict = Depends(get_current_user)):
+    """Response cache hit/miss counters"""
+    return response_cache.stats()
+
+@app.get("/api/metrics/live")
+async def live_metrics(current_user: dict = Depends(get_current_user)):
+    """Open live connections and pushed/coalesced/dropped message counts"""
+    return live_hub.stats()
+
+@app.get("/api/metrics/estimator")
+async def estimator_metrics(current_user: dict = Depends(get_current_user)):
+    """Local estimator hits versus LLM fallbacks"""
+    return local_estimator.stats()
+
+@app.get("/api/metrics/llm")
+async def llm_metrics(current_user: dict = Depends(get_current_user)):
+    """Circuit breaker state per LLM backend and how many replies were degraded"""
+    return llm_stats()
+
 if __name__ == "__main__":
     # Initialize database schema
     init_database()
@@ -0,0 +1,58 @@
+"""
+Meal logging against the layered (user, then global) food catalog
+
+Unknown foods never wait for the LLM: a confident local estimate is stored
+right away, anything else becomes a provisional food with a background job.
+"""
+from datetime import date as dt
+from typing import Any, Dict, List, Optional
+
+import sys
+sys.path.append('..')
+from app.estimator import local_estimator
+from database import lookup_food_id, add_global_food, insert_user_log_items
+from jobs import enqueue_estimate
+
+
+def resolve_or_estimate(user_id: int, name: str, estimated: Optional[List[str]] = None,
+                        pending: Optional[List[Dict[str, Any]]] = None) -> int:
+    """Food id for a name, adding it to the global catalog when nobody has it yet.
+
+    New names are reported in ``estimated``; those still waiting for a
+    background estimate are also reported in ``pending`` with their job id.
+    """
+    food_id = lookup_food_id(user_id, name)
+    if food_id:
+        return food_id
+    if estimated is not None:
+        estimated.append(name)
+
+    local = local_estimator.estimate(name)
+    if local is not None:
+        # Store under the name that was asked for so the next lookup hits
+        add_global_food(name, local.serving_desc, local.macros["cal"], local.macros["protein"],
+                        local.macros["carbs"], local.macros["fat"], "local_estimate")
+    else:
+        job_id = enqueue_estimate(user_id, name)
+        if pending is not None:
+            pending.append({"name": name, "job_id": job_id})
+    # Resolve again: when sharded this pins the new catalog food into the user's shard
+    food_id = lookup_food_id(user_id, name)
+    if food_id:
+        return food_id
+    raise RuntimeError(f"Failed to add estimated food: {name}")
+
+
+def log_user_meal(user_id: int, items: List[Dict[str, Any]], date: Optional[str] = None) -> Dict[str, Any]:
+    """Log a meal's items for a user; reports the date, names newly estimated and pending jobs"""
+    d = date or dt.today().isoformat()
+    if not items:
+        raise ValueError("log_meal requires non-empty items list")
+    resolved, estimated, pending = [], [], []
+    for it in items:
+        name = it.get("name")
+        if not name:
+            raise ValueError("log_meal item missing 'name'")
+        resolved.append((resolve_or_estimate(user_id, name, estimated, pending), float(it.get("qty", 1))))
+    insert_user_log_items(user_id, d, resolved)
+    return {"date": d, "estimated": estimated, "pending": pending}
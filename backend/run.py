@@ -1,22 +1,78 @@
 #!/usr/bin/env python3
 """
 Startup script for the FastAPI backend
+
+    python run.py                 # development: one worker, auto-reload
+    python run.py --workers 4     # production: N workers + a single writer process
 """
+import argparse
+import multiprocessing
+import os
+import secrets
+import socket
+import time
+
 import uvicorn
-from database import init_database
+from database import init_database, BASE
+
+
+def start_writer(socket_path: str) -> multiprocessing.Process:
+    """Start the writer process and wait until it accepts connections"""
+    from writer import serve
+    proc = multiprocessing.Process(target=serve, args=(socket_path,), name="tracker-writer", daemon=True)
+    proc.start()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                s.connect(socket_path)
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError(f"Writer did not start on {socket_path}")
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the nutrition coach API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="more than 1 runs production mode with a single writer process")
+    args = parser.parse_args()
+
     # Initialize database
     print("Initializing database...")
     init_database()
     print("Database initialized!")
-    
-    # Start the server
-    print("Starting FastAPI server...")
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+
+    # Every worker (and every reload) must sign tokens with the same key
+    if not os.getenv("JWT_SECRET"):
+        os.environ["JWT_SECRET"] = secrets.token_urlsafe(32)
+        print("JWT_SECRET not set; using a random key, so tokens end when the server stops")
+
+    if args.workers > 1:
+        socket_path = os.environ.setdefault("TRACKER_WRITER_SOCKET", str(BASE / "db" / "writer.sock"))
+        print(f"Starting writer on {socket_path}...")
+        writer = start_writer(socket_path)
+        print(f"Starting FastAPI server with {args.workers} workers...")
+        try:
+            uvicorn.run(
+                "main:app",
+                host=args.host,
+                port=args.port,
+                workers=args.workers,
+                log_level="info"
+            )
+        finally:
+            writer.terminate()
+    else:
+        # Start the server
+        print("Starting FastAPI server...")
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            reload=True,
+            log_level="info"
+        )
@@ -18,10 +18,13 @@ CREATE TABLE IF NOT EXISTS foods (
   protein REAL NOT NULL,
   carbs REAL NOT NULL,
   fat REAL NOT NULL,
-  provenance TEXT DEFAULT 'user', -- 'user' | 'llm_estimate'
+  provenance TEXT DEFAULT 'user', -- 'user' | 'llm_estimate' | 'local_estimate' | 'pending_estimate'
   UNIQUE(user_id, name)
 );
 
+-- Shared catalog: rows with user_id NULL, one per name (user rows override them)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_foods_global_name ON foods(name) WHERE user_id IS NULL;
+
 -- Updated logs table with user_id
 CREATE TABLE IF NOT EXISTS logs (
   id INTEGER PRIMARY KEY,
@@ -40,6 +43,9 @@ CREATE TABLE IF NOT EXISTS log_items (
   FOREIGN KEY (food_id) REFERENCES foods(id) ON DELETE CASCADE
 );
 
+-- Summary and analytics joins go logs -> log_items
+CREATE INDEX IF NOT EXISTS idx_log_items_log ON log_items(log_id);
+
 -- Updated goals table with user_id
 CREATE TABLE IF NOT EXISTS goals (
   id INTEGER PRIMARY KEY,
@@ -52,6 +58,34 @@ CREATE TABLE IF NOT EXISTS goals (
   UNIQUE(user_id, goal_date)
 );
 
+-- Background estimates for provisional catalog foods (provenance 'pending_estimate')
+CREATE TABLE IF NOT EXISTS estimate_jobs (
+  id INTEGER PRIMARY KEY,
+  food_id INTEGER NOT NULL UNIQUE REFERENCES foods(id) ON DELETE CASCADE,
+  name TEXT NOT NULL,
+  requested_by INTEGER REFERENCES users(id),
+  status TEXT NOT NULL DEFAULT 'queued', -- 'queued' | 'running' | 'done' | 'failed'
+  attempts INTEGER NOT NULL DEFAULT 0,
+  run_after REAL NOT NULL DEFAULT 0, -- unix time, pushed back after a failure
+  lease_until REAL, -- a running job whose lease passed is claimed again
+  last_error TEXT,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_estimate_jobs_claim ON estimate_jobs(status, run_after);
+
+-- Change counters bumped by every write unit: scope 0 is the shared catalog,
+-- any other scope the user with that id. Caches in other processes compare them.
+CREATE TABLE IF NOT EXISTS change_counters (
+  scope INTEGER PRIMARY KEY,
+  version INTEGER NOT NULL
+);
+
 -- Insert demo user for testing
 INSERT OR IGNORE INTO users (id, email, password_hash) 
-VALUES (1, 'demo@example.com', 'dem0123');
+VALUES (1, 'demo@example.com', 'demo123');
+
+-- Older databases were seeded with a mistyped demo password. The plaintext
+-- value is upgraded to a bcrypt hash on first login
+UPDATE users SET password_hash = 'demo123' WHERE id = 1 AND password_hash = 'dem0123';
@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 """
-Seed the database with common foods for testing
+Seed the shared food catalog with common foods
 """
-from database import get_connection, add_user_food
+from database import add_global_food
 
 def seed_foods():
     """Add common foods to the database"""
@@ -66,8 +66,7 @@ def seed_foods():
     print("Seeding database with common foods...")
     for food in foods:
         try:
-            food_id = add_user_food(
-                user_id=1,
+            food_id = add_global_food(
                 name=food["name"],
                 serving_desc=food["serving_desc"],
                 cal=food["cal"],
@@ -0,0 +1,54 @@
+-- Per-user shard: the same tables as schema.sql minus users, which stay in
+-- the main database (so user_id has no foreign key here).
+PRAGMA foreign_keys = ON;
+
+-- User foods, plus catalog foods pinned into this shard (user_id NULL)
+CREATE TABLE IF NOT EXISTS foods (
+  id INTEGER PRIMARY KEY,
+  user_id INTEGER,
+  name TEXT NOT NULL,
+  serving_desc TEXT DEFAULT '1 serving',
+  cal REAL NOT NULL,
+  protein REAL NOT NULL,
+  carbs REAL NOT NULL,
+  fat REAL NOT NULL,
+  provenance TEXT DEFAULT 'user',
+  UNIQUE(user_id, name)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_foods_global_name ON foods(name) WHERE user_id IS NULL;
+
+CREATE TABLE IF NOT EXISTS logs (
+  id INTEGER PRIMARY KEY,
+  user_id INTEGER,
+  log_date TEXT NOT NULL, -- YYYY-MM-DD
+  UNIQUE(user_id, log_date)
+);
+
+CREATE TABLE IF NOT EXISTS log_items (
+  id INTEGER PRIMARY KEY,
+  log_id INTEGER NOT NULL,
+  food_id INTEGER NOT NULL,
+  qty REAL NOT NULL DEFAULT 1,
+  FOREIGN KEY (log_id) REFERENCES logs(id) ON DELETE CASCADE,
+  FOREIGN KEY (food_id) REFERENCES foods(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_log_items_log ON log_items(log_id);
+
+CREATE TABLE IF NOT EXISTS goals (
+  id INTEGER PRIMARY KEY,
+  user_id INTEGER,
+  goal_date TEXT, -- NULL = default
+  cal REAL NOT NULL,
+  protein REAL NOT NULL,
+  carbs REAL NOT NULL,
+  fat REAL NOT NULL,
+  UNIQUE(user_id, goal_date)
+);
+
+-- Change counters of the users in this shard, scope 0 for the pinned catalog foods
+CREATE TABLE IF NOT EXISTS change_counters (
+  scope INTEGER PRIMARY KEY,
+  version INTEGER NOT NULL
+);
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Migrate per-user data from the single database file into shard files
+
+Usage: python shards.py migrate --shards N [--purge]
+
+Run with the server stopped, then start it with TRACKER_SHARDS=N. Users
+and the global food catalog stay in the main database; catalog foods a
+user has logged are pinned into that user's shard.
+"""
+import argparse
+import sqlite3
+from typing import Dict
+
+import database
+
+# Copy order respects foreign keys: foods and logs before log_items
+_COPY_SQL = {
+    "foods": "INSERT INTO foods SELECT * FROM src.foods WHERE user_id = :uid",
+    "pinned": """INSERT OR IGNORE INTO foods
+                 SELECT f.* FROM src.foods f
+                 WHERE f.user_id IS NULL AND f.id IN (
+                   SELECT li.food_id FROM src.log_items li
+                   JOIN src.logs lg ON lg.id = li.log_id WHERE lg.user_id = :uid)""",
+    "logs": "INSERT INTO logs SELECT * FROM src.logs WHERE user_id = :uid",
+    "log_items": """INSERT INTO log_items
+                    SELECT li.* FROM src.log_items li
+                    JOIN src.logs lg ON lg.id = li.log_id WHERE lg.user_id = :uid""",
+    "goals": "INSERT INTO goals SELECT * FROM src.goals WHERE user_id = :uid",
+}
+
+_PURGE_SQL = [
+    "DELETE FROM log_items WHERE log_id IN (SELECT id FROM logs WHERE user_id = :uid)",
+    "DELETE FROM logs WHERE user_id = :uid",
+    "DELETE FROM goals WHERE user_id = :uid",
+    "DELETE FROM foods WHERE user_id = :uid",
+]
+
+
+def migrate(shards: int, purge: bool = False) -> Dict[str, int]:
+    """Copy every user's foods, logs, log items and goals into their shard"""
+    if shards < 1:
+        raise ValueError("--shards must be at least 1")
+    existing = list(database.SHARD_DIR.glob("shard_*.db")) if database.SHARD_DIR.exists() else []
+    if existing:
+        raise RuntimeError(f"{database.SHARD_DIR} already has shard files; refusing to mix data")
+    database.SHARDS = shards
+
+    with database.get_connection() as src:
+        user_ids = [r[0] for r in src.execute(
+            """SELECT user_id FROM foods WHERE user_id IS NOT NULL
+               UNION SELECT user_id FROM logs WHERE user_id IS NOT NULL
+               UNION SELECT user_id FROM goals WHERE user_id IS NOT NULL""")]
+        orphan_logs = src.execute("SELECT COUNT(*) FROM logs WHERE user_id IS NULL").fetchone()[0]
+
+    counts = {table: 0 for table in _COPY_SQL}
+    for uid in user_ids:
+        conn = database.open_shard(database.shard_path(uid))
+        try:
+            conn.execute("ATTACH DATABASE ? AS src", (str(database.DB_PATH),))
+            with conn:
+                for table, sql in _COPY_SQL.items():
+                    counts[table] += conn.execute(sql, {"uid": uid}).rowcount
+        finally:
+            conn.close()
+
+    if purge:
+        with database.get_connection() as src:
+            for uid in user_ids:
+                for sql in _PURGE_SQL:
+                    src.execute(sql, {"uid": uid})
+
+    counts["users"] = len(user_ids)
+    counts["skipped_logs_without_user"] = orphan_logs
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-user SQLite shard tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    m = sub.add_parser("migrate", help="move per-user rows from the main database into shards")
+    m.add_argument("--shards", type=int, required=True)
+    m.add_argument("--purge", action="store_true", help="delete migrated rows from the main database")
+    args = parser.parse_args()
+
+    try:
+        result = migrate(args.shards, args.purge)
+    except (RuntimeError, ValueError, sqlite3.Error) as e:
+        parser.exit(1, f"Migration failed: {e}\n")
+    print(f"Migrated {result.pop('users')} users into {args.shards} shards under {database.SHARD_DIR}")
+    for table, n in result.items():
+        print(f"  {table}: {n}")
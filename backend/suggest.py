@@ -0,0 +1,226 @@
+"""
+Meal suggestions that close the gap between today's totals and the goals
+
+A user's visible foods are held as one float32 macro matrix, rebuilt when
+the catalog changes. Every food at a few serving sizes is scored against
+the remaining macros in one vectorized pass, then every pair among the best
+candidates. That answers the small integer program "which one or two foods,
+at which servings" over the candidate pool with no LLM round trip.
+"""
+import re
+import threading
+from collections import OrderedDict
+from datetime import date as dt
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional
+
+import numpy as np
+
+from database import get_user_foods, get_user_daily_summary
+
+MACROS = ("cal", "protein", "carbs", "fat")
+GOAL_KEYS = ("calories", "protein_g", "carbs_g", "fat_g")
+
+# Servings tried for every food
+QUANTITIES = np.array([0.5, 1.0, 1.5, 2.0, 3.0], dtype=np.float32)
+# Calories and protein matter most; going over a target costs more than falling short
+MACRO_WEIGHTS = np.array([1.0, 1.0, 0.5, 0.5], dtype=np.float32)
+OVERSHOOT_WEIGHT = 3.0
+# Pair search pool: best single foods, plus the foods closest to filling each macro on its own
+POOL_BEST = 64
+POOL_PER_MACRO = 16
+
+# Only questions about food: "recommend a calorie goal" must still reach the LLM
+_SUGGEST_INTENT = re.compile(
+    r"\bwhat (?:should|can|could) i (?:eat|have)\b|\bwhat to eat\b|\bmeal ideas?\b"
+    r"|\b(?:suggest|recommend) (?:a |an |some |something )?(?:meal|food|snack|dinner|lunch|breakfast|to eat)", re.I)
+
+
+def wants_suggestion(message: str) -> bool:
+    """Whether a chat message asks what to eat, so it can be answered without the LLM"""
+    return bool(_SUGGEST_INTENT.search(message or ""))
+
+
+class FoodMatrix(NamedTuple):
+    names: List[str]
+    servings: List[str]
+    macros: np.ndarray   # float32, shape (n, 4) in MACROS order, per serving
+
+
+def build_food_matrix(foods: List[Dict[str, Any]]) -> FoodMatrix:
+    # provisional foods still waiting for an estimate have all-zero macros
+    usable = [f for f in foods if f.get("provenance") != "pending_estimate" and (f.get("cal") or 0) > 0]
+    macros = np.array([[f[m] or 0 for m in MACROS] for f in usable], dtype=np.float32).reshape(-1, len(MACROS))
+    return FoodMatrix([f["name"] for f in usable], [f.get("serving_desc") or "1 serving" for f in usable], macros)
+
+
+class FoodMatrixCache:
+    """Per-user food matrices, LRU-bounded.
+
+    Write paths call ``invalidate`` like they do for the response cache; set
+    ``version_fn`` when other processes write too.
+    """
+
+    def __init__(self, loader: Callable[[int], List[Dict[str, Any]]] = get_user_foods, max_users: int = 64):
+        self.loader = loader
+        self.max_users = max_users
+        self.version_fn: Optional[Callable[[int], Hashable]] = None
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def get(self, user_id: int) -> FoodMatrix:
+        version = self.version_fn(user_id) if self.version_fn else None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+        matrix = build_food_matrix(self.loader(user_id))
+        with self._lock:
+            self._entries[user_id] = (version, matrix)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+            self.builds += 1
+        return matrix
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def invalidate_all(self):
+        """After a shared catalog change"""
+        with self._lock:
+            self._entries.clear()
+
+
+food_matrices = FoodMatrixCache()
+
+
+def _score(gap: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """Weighted squared relative gap over the last axis; lower is better"""
+    rel = gap / scale
+    penalty = np.where(rel < 0, OVERSHOOT_WEIGHT, 1.0).astype(np.float32) * rel * rel
+    return penalty @ MACRO_WEIGHTS
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Flat indices of the k lowest scores, best first"""
+    flat = scores.ravel()
+    k = min(k, flat.size)
+    idx = np.argpartition(flat, k - 1)[:k] if k < flat.size else np.arange(flat.size)
+    return idx[np.argsort(flat[idx], kind="stable")]
+
+
+def suggest(matrix: FoodMatrix, remaining: np.ndarray, scale: np.ndarray, limit: int = 3) -> List[Dict[str, Any]]:
+    """Best one- and two-food combinations for the remaining macros, best first.
+
+    ``remaining`` is goals minus today's totals and ``scale`` the goals, both
+    in MACROS order. Each suggestion lists items (food index, qty), the
+    macros they add and ``gap_closed``, the share of the weighted gap removed;
+    options that remove none are left out, so a day already over its goals gets [].
+
+    Screening ignores the overshoot penalty, which makes the score quadratic:
+    ||r - x||^2 = ||r||^2 - 2 r.x + ||x||^2 in weighted relative units, so
+    all singles cost two matrix-vector products and all pairs of the pool
+    one small Gram matrix. The short list is then scored exactly.
+    """
+    n = len(matrix.names)
+    if n == 0:
+        return []
+    scale = np.maximum(scale, 1.0).astype(np.float32)
+    remaining = remaining.astype(np.float32)
+    baseline = float(_score(remaining, scale))
+    if baseline <= 0:
+        return []
+    k = len(QUANTITIES)
+    root_w = np.sqrt(MACRO_WEIGHTS)
+    x = matrix.macros * (root_w / scale)          # (n, 4) weighted relative macros per serving
+    r = remaining * (root_w / scale)
+    xx, rx, rr = np.einsum("ij,ij->i", x, x), x @ r, float(r @ r)
+
+    # (n, k): every food at every serving
+    single = (xx[:, None] * QUANTITIES ** 2 - 2 * rx[:, None] * QUANTITIES) + rr
+
+    pool = [_top(single.min(axis=1), POOL_BEST)]
+    for m in range(1, len(MACROS)):
+        if r[m] > 0:
+            # serving closest to filling this macro alone
+            pool.append(_top(np.abs(r[m] - x[:, m, None] * QUANTITIES).min(axis=1), POOL_PER_MACRO))
+    pool = np.unique(np.concatenate(pool))
+
+    # every (food, qty) of the pool against every other, each unordered pair once
+    vectors = (x[pool, None, :] * QUANTITIES[None, :, None]).reshape(-1, len(MACROS))
+    owner = np.repeat(pool, k)
+    own = np.einsum("ij,ij->i", vectors, vectors) - 2 * (vectors @ r)
+    pair = own[:, None] + own[None, :] + 2 * (vectors @ vectors.T) + rr
+    pair[owner[:, None] >= owner[None, :]] = np.inf
+
+    shortlist = [((int(f) // k, int(f) % k),) for f in _top(single, limit * k)]
+    for flat in _top(pair, limit * k * k):
+        if not np.isfinite(pair.flat[flat]):
+            break
+        a, b = divmod(int(flat), len(vectors))
+        shortlist.append(((int(owner[a]), a % k), (int(owner[b]), b % k)))
+
+    # exact scores, overshoot penalty included
+    totals = np.array([sum(matrix.macros[food] * QUANTITIES[q] for food, q in items) for items in shortlist])
+    exact = _score(remaining - totals, scale)
+
+    suggestions, seen = [], set()
+    for i in np.argsort(exact, kind="stable"):
+        if exact[i] >= baseline:
+            # this and everything after it leaves the day no closer to the goals than eating nothing
+            break
+        items = shortlist[i]
+        foods = frozenset(food for food, _ in items)
+        if foods in seen:
+            continue
+        seen.add(foods)
+        suggestions.append({
+            "items": [(food, float(QUANTITIES[q])) for food, q in items],
+            "totals": totals[i],
+            "gap_closed": round(1.0 - float(exact[i]) / baseline, 3),
+        })
+        if len(suggestions) == limit:
+            break
+    return suggestions
+
+
+def _macro_dict(values) -> Dict[str, float]:
+    return {m: round(float(v), 1) for m, v in zip(MACROS, values)}
+
+
+def suggest_meals(user_id: int, goals: Dict[str, Any], date: Optional[str] = None,
+                  limit: int = 3) -> Dict[str, Any]:
+    """What to eat to close the gap between the day's totals and ``goals``"""
+    date = date or dt.today().isoformat()
+    totals = get_user_daily_summary(user_id, date)
+    targets = np.array([float(goals[g]) for g in GOAL_KEYS], dtype=np.float32)
+    remaining = targets - np.array([float(totals[m]) for m in MACROS], dtype=np.float32)
+    matrix = food_matrices.get(user_id)
+    suggestions = suggest(matrix, remaining, targets, limit)
+    return {
+        "date": date,
+        "remaining": _macro_dict(remaining),
+        "suggestions": [{
+            "items": [{"name": matrix.names[food], "serving_desc": matrix.servings[food], "qty": qty}
+                      for food, qty in s["items"]],
+            "totals": _macro_dict(s["totals"]),
+            "gap_closed": s["gap_closed"],
+        } for s in suggestions],
+    }
+
+
+def describe(result: Dict[str, Any]) -> str:
+    """One chat sentence for a suggest_meals result"""
+    left = result["remaining"]
+    if not result["suggestions"]:
+        if left["cal"] <= 0:
+            return "You've reached today's calorie goal, so there's nothing left to fill."
+        return "I couldn't find foods in your list that fit what's left today."
+    best = result["suggestions"][0]
+    meal = " + ".join(f"{i['qty']:g} x {i['name']}" for i in best["items"])
+    added = best["totals"]
+    return (f"You have {left['cal']:.0f} kcal and {left['protein']:.0f} g protein left today. "
+            f"Try {meal} ({added['cal']:.0f} kcal, {added['protein']:.0f} g protein).")
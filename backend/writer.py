@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Single-writer process with group commit
+
+Workers send write units over a Unix socket. Each database file (the main
+database or a shard) is owned by one committer thread, which folds every
+unit queued for it into a single transaction (each unit under its own
+savepoint) and acknowledges the units only after COMMIT returns with
+synchronous=FULL.
+
+Usage: python writer.py [socket_path]
+"""
+import builtins
+import json
+import os
+import pathlib
+import queue
+import socket
+import socketserver
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import database
+
+# Upper bound on units folded into one transaction
+MAX_GROUP = 512
+
+# Committer threads; each database file is always handled by the same lane,
+# so there is exactly one writer per file and different shards commit in parallel
+LANES = int(os.getenv("TRACKER_WRITER_LANES", "4"))
+
+# How long a client waits for its unit to be acknowledged
+CLIENT_TIMEOUT = float(os.getenv("TRACKER_WRITER_TIMEOUT", "30"))
+
+
+def _error_reply(e: BaseException) -> Dict[str, Any]:
+    return {"ok": False, "error": str(e), "error_type": type(e).__name__}
+
+
+class _Lane:
+    """A committer thread with its own bounded LRU of write connections"""
+
+    def __init__(self, name: str):
+        self.pending: "queue.Queue" = queue.Queue()
+        self.groups = 0
+        self.units = 0
+        self._conns: "OrderedDict[pathlib.Path, sqlite3.Connection]" = OrderedDict()
+        threading.Thread(target=self._commit_loop, name=name, daemon=True).start()
+
+    def _conn(self, path: pathlib.Path) -> sqlite3.Connection:
+        conn = self._conns.get(path)
+        if conn is not None:
+            self._conns.move_to_end(path)
+            return conn
+        if path == database.DB_PATH:
+            conn = database.get_connection()
+            conn.execute("PRAGMA journal_mode=WAL;")
+        else:
+            conn = database.open_shard(path)
+        conn.isolation_level = None
+        conn.execute("PRAGMA synchronous=FULL;")
+        self._conns[path] = conn
+        while len(self._conns) > database.MAX_OPEN_SHARDS:
+            self._conns.popitem(last=False)[1].close()
+        return conn
+
+    def _commit_loop(self):
+        while True:
+            group = [self.pending.get()]
+            # Everything that queued up during the previous commit joins this one
+            while len(group) < MAX_GROUP:
+                try:
+                    group.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            by_path: "OrderedDict[pathlib.Path, list]" = OrderedDict()
+            for path, request, reply_to in group:
+                by_path.setdefault(path, []).append((request, reply_to))
+            for path, units in by_path.items():
+                try:
+                    self._commit(path, units)
+                except Exception as e:
+                    # never let the lane die: its waiting clients would hang forever
+                    print(f"[writer] commit of {len(units)} units to {path.name} failed: {e!r}")
+                    for _, reply_to in units:
+                        if reply_to.empty():
+                            reply_to.put(_error_reply(e))
+
+    def _commit(self, path: pathlib.Path, group: List[tuple]):
+        replies = []
+        try:
+            conn = self._conn(path)
+            conn.execute("BEGIN IMMEDIATE")
+            for request, _ in group:
+                try:
+                    replies.append({"ok": True, **database.apply_write(
+                        conn, request["statements"], request.get("fetch", False))})
+                except Exception as e:
+                    replies.append(_error_reply(e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn = self._conns.get(path)
+            if conn is not None and conn.in_transaction:
+                conn.execute("ROLLBACK")
+            replies = [_error_reply(e)] * len(group)
+        self.groups += 1
+        self.units += len(group)
+        for (_, reply_to), reply in zip(group, replies):
+            reply_to.put(reply)
+
+
+class WriterServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _WriteHandler)
+        self.lanes = [_Lane(f"group-commit-{i}") for i in range(max(LANES, 1))]
+
+    def submit(self, request: Dict[str, Any], reply_to: "queue.Queue"):
+        path = database.shard_path(request.get("user_id"))
+        lane = self.lanes[zlib.crc32(str(path).encode("utf-8")) % len(self.lanes)]
+        lane.pending.put((path, request, reply_to))
+
+    def stats(self) -> Dict[str, int]:
+        return {"groups": sum(l.groups for l in self.lanes),
+                "units": sum(l.units for l in self.lanes),
+                "lanes": len(self.lanes)}
+
+
+class _WriteHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        reply_to: "queue.Queue" = queue.Queue(maxsize=1)
+        for line in self.rfile:
+            request = json.loads(line)
+            if request.get("stats"):
+                reply = {"ok": True, **self.server.stats()}
+            else:
+                self.server.submit(request, reply_to)
+                reply = reply_to.get()
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class WriterClient:
+    """Thread-safe client; each thread keeps its own connection to the writer"""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._local = threading.local()
+
+    def _stream(self):
+        stream = getattr(self._local, "stream", None)
+        if stream is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(CLIENT_TIMEOUT)
+            sock.connect(self.socket_path)
+            stream = self._local.stream = sock.makefile("rwb")
+        return stream
+
+    def _drop_stream(self):
+        stream, self._local.stream = getattr(self._local, "stream", None), None
+        if stream is not None:
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    def _request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            stream = self._stream()
+            stream.write(json.dumps(payload).encode("utf-8") + b"\n")
+            stream.flush()
+            line = stream.readline()
+        except OSError as e:
+            # includes timeouts; a late reply must not be read as the next unit's
+            self._drop_stream()
+            raise sqlite3.OperationalError(f"writer unavailable: {e}")
+        if not line:
+            self._drop_stream()
+            raise sqlite3.OperationalError("writer closed the connection")
+        return json.loads(line)
+
+    def execute(self, statements: List[Dict[str, Any]], fetch: bool = False,
+                user_id: Optional[int] = None) -> Dict[str, Any]:
+        """Send a write unit for a user's shard (None: shared data) and wait until it is durably committed"""
+        reply = self._request({"statements": statements, "fetch": fetch, "user_id": user_id})
+        if not reply.pop("ok"):
+            # Surface the same exception type a local write would have raised
+            error_type = getattr(sqlite3, reply["error_type"], None) or getattr(builtins, reply["error_type"], None)
+            if not (isinstance(error_type, type) and issubclass(error_type, Exception)):
+                error_type = sqlite3.DatabaseError
+            raise error_type(reply["error"])
+        return reply
+
+    def stats(self) -> Dict[str, Any]:
+        reply = self._request({"stats": True})
+        reply.pop("ok")
+        return reply
+
+
+def serve(socket_path: str):
+    server = WriterServer(socket_path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    import sys
+    path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("TRACKER_WRITER_SOCKET", str(database.BASE / "db" / "writer.sock"))
+    print(f"Writer listening on {path}")
+    serve(path)
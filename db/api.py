@@ -25,11 +25,27 @@ def set_default_goal(calories, protein_g, carbs_g, fat_g):
             carbs=excluded.carbs, fat=excluded.fat
         """, (calories, protein_g, carbs_g, fat_g))
 
-def lookup_food_id(name:str):
+def lookup_food_id(name:str, user_id=None):
+    # with a user, their own food wins over the shared (user_id NULL) catalog row
     with _conn() as c:
-        r = c.execute("SELECT id FROM foods WHERE name=?", (name,)).fetchone()
+        if user_id is None:
+            r = c.execute("SELECT id FROM foods WHERE name=?", (name,)).fetchone()
+        else:
+            r = c.execute("""
+              SELECT id FROM foods WHERE name=? AND (user_id=? OR user_id IS NULL)
+              ORDER BY user_id IS NULL LIMIT 1
+            """, (name, user_id)).fetchone()
         return r[0] if r else None
 
+def reference_foods():
+    # rows for app.estimator; its own estimates are not reused as references
+    with _conn() as c:
+        rows = c.execute("""
+          SELECT name, serving_desc, cal, protein, carbs, fat FROM foods
+          WHERE provenance IS NOT 'local_estimate'
+        """).fetchall()
+    return [dict(zip(("name","serving_desc","cal","protein","carbs","fat"), r)) for r in rows]
+
 def add_food(name, serving_desc, cal, protein, carbs, fat, provenance="user"):
     with _conn() as c:
         c.execute("""
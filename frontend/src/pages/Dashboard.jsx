@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { nutritionAPI } from '../services/api';
+import { nutritionAPI, subscribeLive } from '../services/api';
 import { Chart as ChartJS, ArcElement, Tooltip, Legend } from 'chart.js';
 import { Doughnut } from 'react-chartjs-2';
 
@@ -11,7 +11,18 @@ const Dashboard = () => {
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-    loadData();
+    // The live channel sends the current totals and goals first, then every change
+    return subscribeLive({
+      onMessage: (message) => {
+        if (message.type === 'summary') {
+          setSummary(message.summary);
+        } else if (message.type === 'goals') {
+          setGoals(message.goals);
+        }
+        setLoading(false);
+      },
+      onError: loadData
+    });
   }, []);
 
   const loadData = async () => {
@@ -3,6 +3,7 @@ import { foodsAPI, mealsAPI } from '../services/api';
 
 const FoodLog = () => {
   const [foods, setFoods] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
   const [selectedFoods, setSelectedFoods] = useState([]);
   const [loading, setLoading] = useState(false);
@@ -12,10 +13,12 @@ const FoodLog = () => {
     loadFoods();
   }, []);
 
-  const loadFoods = async () => {
+  const loadFoods = async (cursor = null) => {
     try {
-      const response = await foodsAPI.getFoods(searchTerm);
-      setFoods(response.data);
+      const response = await foodsAPI.getFoods(searchTerm, cursor);
+      const { items, next_cursor } = response.data;
+      setFoods(cursor ? [...foods, ...items] : items);
+      setNextCursor(next_cursor);
     } catch (error) {
       console.error('Error loading foods:', error);
     }
@@ -96,7 +99,7 @@ const FoodLog = () => {
 
           <div style={{ maxHeight: '400px', overflowY: 'auto' }}>
             {foods.map(food => (
-              <div key={food.id} className="flex flex-between" style={{ 
+              <div key={`${food.scope}-${food.id}`} className="flex flex-between" style={{ 
                 padding: '10px', 
                 border: '1px solid #ddd', 
                 borderRadius: '4px',
@@ -120,6 +123,11 @@ const FoodLog = () => {
                 </button>
               </div>
             ))}
+            {nextCursor && (
+              <button onClick={() => loadFoods(nextCursor)} className="btn" style={{ width: '100%' }}>
+                Load more
+              </button>
+            )}
           </div>
         </div>
 
@@ -134,7 +142,7 @@ const FoodLog = () => {
             <>
               <div style={{ maxHeight: '300px', overflowY: 'auto', marginBottom: '20px' }}>
                 {selectedFoods.map(food => (
-                  <div key={food.id} className="flex flex-between" style={{ 
+                  <div key={`${food.scope}-${food.id}`} className="flex flex-between" style={{ 
                     padding: '10px', 
                     border: '1px solid #ddd', 
                     borderRadius: '4px',
@@ -19,6 +19,19 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// Expired or invalid token: drop the session and go back to login
+api.interceptors.response.use(
+  (response) => response,
+  (error) => {
+    if (error.response?.status === 401 && !error.config.url.startsWith('/api/auth/')) {
+      localStorage.removeItem('token');
+      localStorage.removeItem('user');
+      window.location.assign('/login');
+    }
+    return Promise.reject(error);
+  }
+);
+
 // Auth API
 export const authAPI = {
   login: (email, password) => 
@@ -30,8 +43,9 @@ export const authAPI = {
 
 // Foods API
 export const foodsAPI = {
-  getFoods: (search = '') => 
-    api.get(`/api/foods?search=${search}`),
+  // Returns { items, next_cursor }; pass next_cursor back for the following page
+  getFoods: (search = '', cursor = null, limit = 100) =>
+    api.get('/api/foods', { params: { search: search || undefined, cursor: cursor || undefined, limit } }),
   
   addFood: (foodData) => 
     api.post('/api/foods', foodData),
@@ -56,6 +70,10 @@ export const nutritionAPI = {
   
   setGoals: (goals) => 
     api.post('/api/goals', goals),
+
+  // Returns { date, remaining, suggestions: [{ items, totals, gap_closed }] }
+  getSuggestions: (date = null, limit = 3) =>
+    api.get('/api/suggestions', { params: { date: date || undefined, limit } }),
 };
 
 // Chat API
@@ -64,4 +82,41 @@ export const chatAPI = {
     api.post('/api/chat', { message, history }),
 };
 
+// Live updates: pushes { type: 'summary', date, summary } and { type: 'goals', goals },
+// starting with the current state. Reconnects with backoff; returns an unsubscribe function.
+export const subscribeLive = ({ date = null, onMessage, onError }) => {
+  const url = `${API_BASE_URL.replace(/^http/, 'ws')}/api/live${date ? `?date=${date}` : ''}`;
+  let socket = null;
+  let retryDelay = 1000;
+  let retryTimer = null;
+  let stopped = false;
+
+  const connect = () => {
+    socket = new WebSocket(url);
+    socket.onopen = () => {
+      socket.send(JSON.stringify({ token: localStorage.getItem('token') }));
+    };
+    socket.onmessage = (event) => {
+      retryDelay = 1000;
+      onMessage(JSON.parse(event.data));
+    };
+    socket.onclose = (event) => {
+      if (stopped) return;
+      onError?.(event);
+      // 4401: token rejected, so retrying won't help; REST calls will send the user to login
+      if (event.code !== 4401) {
+        retryTimer = setTimeout(connect, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 30000);
+      }
+    };
+  };
+
+  connect();
+  return () => {
+    stopped = true;
+    clearTimeout(retryTimer);
+    socket?.close();
+  };
+};
+
 export default api;